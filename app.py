@@ -1,14 +1,20 @@
 import requests 
 import os.path
 import streamlit as st
-import mmh3
-import numpy as np
 import time
 import hashlib
 import pandas as pd
-import threading
 from datetime import datetime
-from auth import get_gmail_service
+from auth import get_gmail_service, gmail_service_factory
+import scanner
+from cache import MetadataCache
+from jobs import DeleteJobs
+from filters import FilterManager
+from sampling import SampleScan
+import snapshot
+from store import ACTIONED, HIDDEN, IGNORED
+from governor import governor_for
+from metrics import METRICS, timed
 import streamlit.components.v1 as components
 
 # <!-- Google Tag Manager -->
@@ -23,37 +29,84 @@ j=d.createElement(s),dl=l!='dataLayer'?'&l='+l:'';j.async=true;j.src=
 """
 # <!-- End Google Tag Manager -->
 
+script_started = time.perf_counter() # Whole-page rerun time, recorded at the bottom
+
 # This injects the tag into the app invisibly
 with st.container():
     components.html(gtm_script, height=0, width=0)
 
 # --- 1. INITIALIZATION & CONNECTION ---
-if 'leaderboard' not in st.session_state:
-    st.session_state.leaderboard = {}
-if 'total_size' not in st.session_state: # NEW: Tracks total inbox size in bytes
-    st.session_state.total_size = 0
-if 'sender_sizes' not in st.session_state: # NEW: Tracks size per sender for accurate deletion
-    st.session_state.sender_sizes = {}
-if 'grid' not in st.session_state:
-    st.session_state.grid = np.zeros((4, 1000))
+if 'history_id' not in st.session_state: # Scan results: sender table (counts, sizes, ignored/actioned flags), message index
+    scanner.reset_scan(st.session_state)
 if 'last_scanned' not in st.session_state:
     st.session_state.last_scanned = None
+if 'scan_limit' not in st.session_state: # Messages per full scan, 0 = the whole inbox
+    st.session_state.scan_limit = 0
 if 'user_id_hash' not in st.session_state:
     st.session_state.user_id_hash = None
-if 'excluded_senders' not in st.session_state: 
-    st.session_state.excluded_senders = set()
-if 'actioned_senders' not in st.session_state: # NEW: Tracks processed rows
-    st.session_state.actioned_senders = set()
+if 'delete_jobs' not in st.session_state: # Background trash jobs, created on first Delete
+    st.session_state.delete_jobs = None
+if 'delete_polling' not in st.session_state: # The progress fragment is polling running delete jobs
+    st.session_state.delete_polling = False
+if 'trash_unsaved' not in st.session_state: # Trashed messages uncounted but not yet in the snapshot
+    st.session_state.trash_unsaved = False
+if 'filter_manager' not in st.session_state: # Cached filter list + senders queued for blocking
+    st.session_state.filter_manager = FilterManager()
+if 'sample_scan' not in st.session_state: # Background random-sample estimate, see sampling.py
+    st.session_state.sample_scan = None
+if 'sample_polling' not in st.session_state: # The estimate fragment is polling a running sample
+    st.session_state.sample_polling = False
+if 'snapshot_checked' not in st.session_state: # Looked for a saved scan of this account yet, see snapshot.py
+    st.session_state.snapshot_checked = False
 
 # --- 2. GMAIL & MATH ENGINE ---
-def update_sketch(email):
-    """Uses Count-Min Sketch to estimate sender frequency."""
-    counts = []
-    for row in range(4):
-        col = mmh3.hash(email, row) % 1000
-        st.session_state.grid[row][col] += 1
-        counts.append(st.session_state.grid[row][col])
-    st.session_state.leaderboard[email] = int(min(counts))
+# Pagination, batched metadata fetch and sender aggregation live in scanner.py / store.py
+
+@st.cache_resource
+def get_metadata_cache():
+    """One on-disk message metadata cache shared by every session on this server."""
+    return MetadataCache()
+
+def get_user_id_hash(service):
+    """Privacy-safe account ID: sha256 of the address, used for logging and the cache."""
+    if not st.session_state.user_id_hash:
+        user_profile = governor_for(service).execute(service.users().getProfile(userId='me'))
+        user_email = user_profile['emailAddress']
+        st.session_state.user_id_hash = hashlib.sha256(user_email.encode()).hexdigest()
+    return st.session_state.user_id_hash
+
+def save_snapshot():
+    """Keeps the scan and the user's marks on disk, so a refresh or redeploy doesn't lose them.
+
+    A full save takes most of a second on a large inbox, so it only runs after a scan and once
+    the delete jobs finish; clicks that just mark senders use save_marks().
+    """
+    if st.session_state.user_id_hash:
+        try:
+            snapshot.save(st.session_state, snapshot.path_for(st.session_state.user_id_hash))
+        except OSError as e:
+            st.toast(f"Couldn't save your scan for next time: {e}")
+
+def save_marks():
+    """Keeps the Ignore / Delete / Refresh / Include Back marks on disk without rewriting the scan."""
+    if st.session_state.user_id_hash:
+        try:
+            snapshot.save_flags(st.session_state, snapshot.path_for(st.session_state.user_id_hash))
+        except OSError as e:
+            st.toast(f"Couldn't save your changes for next time: {e}")
+
+# A returning user gets their last scan back from disk instead of rescanning. This runs once per
+# session, as soon as we know the account, and costs one profile call
+if 'code' in st.query_params and 'google_creds' not in st.session_state:
+    get_gmail_service() # Back from the OAuth redirect: finish signing in, which reruns the page
+if not st.session_state.snapshot_checked and 'google_creds' in st.session_state:
+    st.session_state.snapshot_checked = True
+    try:
+        user_id_hash = get_user_id_hash(get_gmail_service())
+    except Exception: # A failed lookup only means starting without the saved scan
+        user_id_hash = None
+    if user_id_hash and not len(st.session_state.senders):
+        snapshot.load(st.session_state, snapshot.path_for(user_id_hash))
 
 # def delete_existing_emails(service, sender_email):
 #     """Trashes unread emails from a specific sender."""
@@ -83,71 +136,51 @@ def update_sketch(email):
 #         st.error(f"Gmail API Error: {e}")
 #         return 0
 
-def delete_existing_emails(service, sender_email):
-    """Trashes ALL emails from a specific sender by looping through all pages."""
-    query = f"from:{sender_email} in:inbox"
-    total_deleted = 0
-    next_page_token = None
-    
+# Deletes run as background jobs over the scanned message IDs, see jobs.py
+def get_delete_jobs():
+    if st.session_state.delete_jobs is None:
+        st.session_state.delete_jobs = DeleteJobs(gmail_service_factory())
+    return st.session_state.delete_jobs
+
+def apply_trashed():
+    """Uncounts the messages the delete jobs trashed since the last rerun."""
+    delete_jobs = st.session_state.delete_jobs
+    if delete_jobs is not None:
+        trashed = delete_jobs.collect_trashed()
+        if trashed:
+            scanner.remove_messages(st.session_state, trashed, rerank=False)
+            st.session_state.trash_unsaved = True
+        # One full save when the jobs are done, not one per trashed chunk
+        if st.session_state.trash_unsaved and not delete_jobs.active():
+            st.session_state.trash_unsaved = False
+            save_snapshot()
+
+def create_future_filter(service, sender_emails, user_id_hash):
+    """Creates Gmail filters to auto-trash future emails, merging senders into few filters.
+
+    Returns (created, skipped), or None after showing the error if Gmail refused.
+    """
     try:
-        while True:
-            # 1. Fetch a page of messages
-            results = service.users().messages().list(
-                userId='me', 
-                q=query, 
-                pageToken=next_page_token
-            ).execute()
-            
-            messages = results.get('messages', [])
-            if not messages and total_deleted == 0:
-                st.toast(f"No emails found for {sender_email}")
-                return 0
-            elif not messages:
-                break # No more pages left
-
-            # 2. Batch delete this page (max 1000 per Gmail API limit)
-            msg_ids = [m['id'] for m in messages]
-            service.users().messages().batchModify(
-                userId='me',
-                body={
-                    'ids': msg_ids,
-                    'addLabelIds': ['TRASH'],
-                    'removeLabelIds': ['INBOX']
-                }
-            ).execute()
-            
-            total_deleted += len(messages)
-            
-            # 3. Check if there's another page
-            next_page_token = results.get('nextPageToken')
-            if not next_page_token:
-                break
-        
-        return total_deleted
-
-    except Exception as e:
-        st.error(f"Gmail API Error during mass delete: {e}")
-        return 0
-
-def create_future_filter(service, sender_email, user_id_hash):
-    """Creates a Gmail filter to auto-trash future emails."""
-    filter_rule = {
-        'criteria': {'from': sender_email},
-        'action': {'addLabelIds': ['TRASH'], 'removeLabelIds': ['INBOX']}
-    }
-    try:
-        service.users().settings().filters().create(userId='me', body=filter_rule).execute()
+        created, skipped = st.session_state.filter_manager.block(service, sender_emails)
 #        log_event(user_id_hash, "block")
+        return created, skipped
     except Exception as e:
         st.error(f"Filter Error: {e}")
+        return None
 
 @st.dialog("Confirm Auto-Delete Filter")
-def confirm_future_delete(service, sender_email, user_id_hash):
-    st.warning(f"This will create a permanent Gmail filter for **{sender_email}**.")
-    st.write("Future emails from this sender will go straight to the Trash.")
+def confirm_future_delete(service, sender_emails, user_id_hash):
+    st.warning(f"This will create a permanent Gmail filter for **{len(sender_emails)}** sender(s):")
+    st.write(", ".join(f"`{s}`" for s in sender_emails))
+    st.write("Future emails from these senders will go straight to the Trash.")
     if st.button("Confirm Block"):
-        create_future_filter(service, sender_email, user_id_hash)
-        st.success(f"Blocked {sender_email}!")
+        result = create_future_filter(service, sender_emails, user_id_hash)
+        if result is None:
+            return # Keep the error on screen and the senders queued, so Confirm can be retried
+        created, skipped = result
+        st.session_state.filter_manager.pending = set()
+        st.success(f"Blocked {len(sender_emails)} senders with {created} new filter(s) "
+                   f"({skipped} were already blocked).")
         st.rerun()
 
 # --- 3. MAIN UI ---
@@ -157,6 +190,8 @@ st.title("📬 Clean up your Gmail")
 # Helper to format size nicely
 def format_size(size_bytes):
     mb = size_bytes / (1024 * 1024)
+    if 0 < mb < 1:
+        return f"{size_bytes / 1024:.0f} KB"
     if mb < 1024:
         return f"{mb:.1f} MB"
     return f"{mb/1024:.2f} GB"
@@ -165,6 +200,8 @@ def format_size(size_bytes):
 if 'total_size' not in st.session_state:
     st.session_state.total_size = 0
 
+apply_trashed()
+
 # Display Timestamp and size 
 
 # Create two columns for the Metadata (Time and Size)
@@ -185,80 +222,155 @@ with meta_col2:
         help="This size is an estimate, in order to free up the space you will have to go to your trash in gmail and click on 'empty trash'."
     )
 
-col_a, col_b = st.columns(2)
+col_a, col_b, col_c = st.columns(3)
 
 with col_a:
     if st.button("🚀 Start Scanning All Inbox Emails", use_container_width=True):
         service = get_gmail_service()
-        all_messages = []
-        next_page_token = None
-        target_limit = 20000
 
         # Create user hash for privacy-safe logging
-        user_profile = service.users().getProfile(userId='me').execute()
-        user_email = user_profile['emailAddress']
-        st.session_state.user_id_hash = hashlib.sha256(user_email.encode()).hexdigest()
+        user_id_hash = get_user_id_hash(service)
         
         # Log the scan event
 #        log_event(st.session_state.user_id_hash, "scan")
         
-        status_msg = st.info("📑 Gathering email list...")
-        while len(all_messages) < target_limit:
-            results = service.users().messages().list(
-                userId='me', q='label:inbox -label:trash', 
-                maxResults=1000, pageToken=next_page_token
-            ).execute()
-            all_messages.extend(results.get('messages', []))
-            next_page_token = results.get('nextPageToken')
-            if not next_page_token: break
-        
-        messages = all_messages[:target_limit]
-        total = len(messages)
-        status_msg.empty()
-        
         progress_text = st.empty()
         bar = st.progress(0)
-        
-        def batch_callback(request_id, response, exception):
-            if exception is None:
-                headers = response.get('payload', {}).get('headers', [])
-                sender = next((h['value'] for h in headers if h['name'] == 'From'), "Unknown")
-                size = response.get('sizeEstimate', 0)
-                st.session_state.total_size += size
-                st.session_state.sender_sizes[sender] = st.session_state.sender_sizes.get(sender, 0) + size
-                update_sketch(sender)
-
-        batch_size = 50
-        for i in range(0, total, batch_size):
-            batch = service.new_batch_http_request(callback=batch_callback)
-            for msg in messages[i : i + batch_size]:
-                batch.add(service.users().messages().get(
-                    userId='me', id=msg['id'], format='metadata', metadataHeaders=['From']
-                ))
-            batch.execute()
-            
-            pct = min((i + batch_size) / total, 1.0)
-            bar.progress(pct)
-            progress_text.text(f"Scanning {i + batch_size} / {total} emails...")
+        live_table = st.empty()
+        last_preview = [0.0]
+
+        def show_progress(progress):
+            # Listing runs ahead of the fetchers, so `listed` grows while we scan
+            bar.progress(progress.done / max(progress.listed, 1))
+            still_listing = "" if progress.listing_done else " (still listing inbox)"
+            progress_text.text(f"Scanning {progress.done} / {progress.listed} emails...{still_listing}")
+            # Partial ranking from what has been scanned so far, redrawn at most once a second
+            if time.monotonic() - last_preview[0] >= 1.0:
+                last_preview[0] = time.monotonic()
+                partial = scanner.top_senders(st.session_state, 15)
+                live_table.dataframe(pd.DataFrame(partial, columns=["Sender", "Emails so far"]),
+                                     use_container_width=True, hide_index=True)
+
+        # Only replays the History API deltas when a previous scan left a historyId
+        # Messages fetched in an earlier session come from the on-disk cache
+        # One pass, not date-range shards: the per-user quota caps both, and shards add planning calls
+        cache = get_metadata_cache().for_account(user_id_hash)
+        mode, count = scanner.scan_inbox(gmail_service_factory(), st.session_state,
+                                         limit=st.session_state.scan_limit or None,
+                                         on_progress=show_progress, cache=cache)
+        live_table.empty()
+        if mode == 'incremental':
+            progress_text.text(f"⚡ Applied {count} inbox changes since the last scan.")
         
         st.session_state.last_scanned = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        save_snapshot()
         # st.rerun()
 
+with col_b:
+    # A quick scan starts over from the largest emails only, so it never replaces a complete scan's exact results
+    full_results = st.session_state.scan_complete
+    if st.button("⚡ Quick Scan for Storage Hogs", use_container_width=True, disabled=full_results,
+                 help="You already have exact results: rank them by 💾 Storage reclaimed below, "
+                      "or Reset All Data to start over." if full_results else
+                      "Counts the inbox by size with a few searches, then only fetches the largest emails."):
+        service = get_gmail_service()
+        cache = get_metadata_cache().for_account(get_user_id_hash(service))
+        progress_text = st.empty()
+
+        def show_quick_progress(progress):
+            progress_text.text(f"Fetching {progress.done} / {progress.listed} large emails...")
+
+        fetched = scanner.storage_prescan(gmail_service_factory(), st.session_state,
+                                          on_progress=show_quick_progress, cache=cache)
+        progress_text.text(f"⚡ Ranked senders from the {fetched} largest emails.")
+        save_snapshot()
+        st.session_state.rank_by = "💾 Storage reclaimed"
+
+with col_c:
+    if st.button("🎲 Quick Estimate from a Sample", use_container_width=True,
+                 help="Ranks senders from a random sample of your inbox within seconds, "
+                      "then keeps refining in the background until every email is counted."):
+        service = get_gmail_service()
+        cache = get_metadata_cache().for_account(get_user_id_hash(service))
+        if st.session_state.sample_scan is not None:
+            st.session_state.sample_scan.stop()
+        st.session_state.sample_scan = SampleScan(gmail_service_factory(), cache=cache).start()
+
+def sample_running():
+    """A sample is still being drawn, or has finished as a census that isn't adopted yet."""
+    sample = st.session_state.sample_scan
+    return sample is not None and (sample.active() or sample.status == 'done')
+
+# Only polls while the sample runs, like the delete progress below
+@st.fragment(run_every=2 if sample_running() else None)
+@timed('render_sample_estimate')
+def render_sample_estimate():
+    """Live sample-based ranking with 95% intervals; becomes the real results once every email is sampled."""
+    sample = st.session_state.sample_scan
+    if sample is None:
+        return
+    if sample.status == 'done':
+        # The sample grew into a census of the inbox: adopt it like a full scan, keeping the user's marks
+        sample.state.senders.copy_flags(st.session_state.senders, IGNORED | ACTIONED)
+        for name, value in vars(sample.state).items():
+            st.session_state[name] = value
+        st.session_state.sample_scan = None
+        st.session_state.sample_polling = False
+        st.session_state.last_scanned = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        save_snapshot()
+        st.rerun()
+    if st.session_state.sample_polling and not sample.active():
+        # Sampling stopped or failed: one full rerun draws the final estimate and stops polling
+        st.session_state.sample_polling = False
+        st.rerun()
+    st.session_state.sample_polling = sample.active()
+    if sample.status == 'failed':
+        st.error(f"Sampling failed: {sample.error}")
+        return
+    if not sample.ready():
+        st.caption(f"🎲 Drawing a random sample of your inbox... ({sample.sampled} emails so far)")
+        return
+
+    st.subheader("🎲 Estimated Heavy Hitters")
+    st.caption(f"From a random sample of {sample.sampled:,} of your {sample.population:,} emails; "
+               f"ranges are 95% confidence intervals and narrow as sampling continues.")
+    st.dataframe(pd.DataFrame([
+        {"Sender": sender, "Est. emails": round(count), "Range": f"{low:,.0f} – {high:,.0f}",
+         "Est. size": format_size(size), "Size range": f"{format_size(size_low)} – {format_size(size_high)}"}
+        for sender, count, low, high, size, size_low, size_high
+        in sample.estimates(15, exclude=st.session_state.senders.flagged(IGNORED))
+    ]), hide_index=True, use_container_width=True)
+    if sample.active():
+        st.progress(sample.sampled / max(sample.population, 1), text="Refining in the background...")
+        if st.button("⏹️ Stop Refining"):
+            sample.stop()
+
+render_sample_estimate()
+
+# A quick scan only saw the big emails; say so until a full scan replaces it
+if st.session_state.size_histogram and not st.session_state.scan_complete:
+    st.info("These results come from a quick scan of your largest emails only. "
+            "Run the full scan for exact counts of every sender.")
+    with st.expander("📦 Inbox size breakdown (estimated)"):
+        st.bar_chart(pd.DataFrame({
+            "Size": [f"{format_size(lower or 0)} – {format_size(upper) if upper else 'more'}"
+                     for lower, upper, _, _ in st.session_state.size_histogram],
+            "Emails": [messages for _, _, messages, _ in st.session_state.size_histogram],
+        }).set_index("Size"))
+
 with st.sidebar:
     st.header("⚙️ App Controls")
     
     if st.button("🗑️ Reset All Data", use_container_width=True):
-        st.session_state.grid = np.zeros((4, 1000))
-        st.session_state.leaderboard = {}
+        scanner.reset_scan(st.session_state, keep_flags=0) # Also drops the historyId and ignored senders
         st.session_state.last_scanned = None
-
-# ADD THESE TWO LINES TO CLEAR THE SIZE METRICS
-        st.session_state.total_size = 0
-        st.session_state.sender_sizes = {}
-        st.session_state.excluded_senders = set()
-        st.session_state.actioned_senders = set()
+        if st.session_state.user_id_hash: # ... and the saved copy, or the next visit would bring it back
+            snapshot.delete(snapshot.path_for(st.session_state.user_id_hash))
         st.rerun()
     
+    st.number_input("Max emails per scan (0 = whole inbox)", min_value=0, step=5000, key='scan_limit',
+                    help="Large inboxes scan fully by default; a limit makes the first scan quicker.")
+
     st.info("Tip: Close this sidebar using the arrow (>) at the top left for a full-screen table view.")
 
 # # --- 4. RESULTS ORGANIZATION ---
@@ -343,36 +455,27 @@ with st.sidebar:
 
 # --- 4. RESULTS ORGANIZATION ---
 @st.fragment
+@timed('render_table')
 def render_heavy_hitters():
-    if not st.session_state.leaderboard:
+    senders = st.session_state.senders
+    if not len(senders):
         return
 
     st.divider()
     st.subheader("📊 Ranked Heavy Hitters")
     
-    # 1. Filter and get candidates
-    all_candidates = sorted(st.session_state.leaderboard.items(), key=lambda x: x[1], reverse=True)
-    candidates = [c for c in all_candidates if c[0] not in st.session_state.excluded_senders][:15]
-    
     service = get_gmail_service()
-    
-    # 2. Verify top 15
-    verified_data = []
-    # Add a caption so users know why it might pause for a split second
-    status_msg = st.empty()
-    status_msg.caption("Refining rankings...") 
-    
-    for sender, estimate in candidates:
-        try:
-            res = service.users().messages().list(userId='me', q=f"from:{sender} in:inbox", maxResults=1000).execute()
-            count = len(res.get('messages', []))
-            verified_data.append((sender, count))
-        except:
-            verified_data.append((sender, estimate))
-    
-    top_k = sorted(verified_data, key=lambda x: x[1], reverse=True)
 
-    # 3. Static Table Display
+    # 1. Filter and rank by the exact counts (or bytes) the scan collected. Only a scan that hit its
+    #    message limit falls back to live counts, cached per sender between reruns.
+    rank_by = st.radio("Rank by", ["📨 Emails", "💾 Storage reclaimed"], horizontal=True, key='rank_by')
+    if rank_by == "💾 Storage reclaimed":
+        top_k = [(sender, scanner.sender_count(st.session_state, sender)) for sender, _ in
+                 scanner.top_senders(st.session_state, 15, by='size')]
+    else:
+        top_k = scanner.top_senders(st.session_state, 15, service=service)
+
+    # 2. Static Table Display
     with st.container(border=True):
         st.columns([1, 4, 2, 4]) # Headers placeholder
         
@@ -381,44 +484,88 @@ def render_heavy_hitters():
             c1.write(f"#{rank}")
             c2.write(f"`{sender}`")
             
-            if sender in st.session_state.actioned_senders or sender in st.session_state.excluded_senders:
+            if senders.has_flag(sender, ACTIONED):
                 c3.write("✅")
-                c4.caption("Processed")
+                job_status = st.session_state.delete_jobs.describe(sender) if st.session_state.delete_jobs else None
+                c4.caption(job_status or "Processed")
             else:
-                c3.write(f"**{exact_count}**")
+                c3.write(f"**{exact_count}** · {format_size(senders.size(sender))}")
                 btn_col1, btn_col2, btn_col3 = c4.columns(3)
                 
                 if btn_col1.button("Delete", key=f"del_{sender}"):
-                    st.session_state.actioned_senders.add(sender)
-                    # Update size metric immediately
-                    st.session_state.total_size -= st.session_state.sender_sizes.get(sender, 0)
-                    
-                    thread = threading.Thread(target=delete_existing_emails, args=(service, sender))
-                    thread.start()
+                    senders.set_flag(sender, ACTIONED)
+                    # Trash by the IDs the scan collected; a scan that hit its limit falls back to a from: search
+                    message_ids = st.session_state.sender_messages.get(sender) if st.session_state.scan_complete else None
+                    get_delete_jobs().submit(sender, message_ids)
+                    save_marks()
                     st.toast(f"Cleaning {sender}...")
-                    st.rerun(scope="fragment") # Reruns ONLY this table
+                    st.rerun() # Full rerun, so the delete progress fragment starts polling
 
-                if btn_col2.button("Block", key=f"fut_{sender}"):
-                    confirm_future_delete(service, sender, st.session_state.user_id_hash)
+                # Blocks are queued and turned into a few merged filters in one go below
+                pending_blocks = st.session_state.filter_manager.pending
+                if btn_col2.button("Blocked" if sender in pending_blocks else "Block", key=f"fut_{sender}",
+                                   disabled=sender in pending_blocks):
+                    pending_blocks.add(sender)
+                    st.rerun(scope="fragment")
 
                 if btn_col3.button("Ignore", key=f"ign_{sender}"):
-                    st.session_state.excluded_senders.add(sender)
+                    senders.set_flag(sender, IGNORED) # Drops it from the ranking
+                    save_marks()
                     st.rerun(scope="fragment")
 
+    # Size spread per sender: a few huge attachments vs. many small notifications
+    with st.expander("📐 Size distribution of these senders"):
+        distribution = scanner.size_distribution(st.session_state, [sender for sender, _ in top_k])
+        byte_columns = ['total', 'median', 'p90', 'largest']
+        distribution[byte_columns] = (distribution[byte_columns] / 1024).round(1)
+        st.dataframe(distribution.rename(columns={c: f"{c} (KB)" for c in byte_columns}), use_container_width=True)
+
+    # 3. Create filters for everything queued with Block
+    pending_blocks = sorted(st.session_state.filter_manager.pending)
+    if pending_blocks:
+        if st.button(f"🚫 Create Filters for {len(pending_blocks)} Blocked Sender(s)", use_container_width=True):
+            confirm_future_delete(service, pending_blocks, st.session_state.user_id_hash)
+
     # 4. The Sweep/Refresh Button inside the fragment
-    if st.session_state.actioned_senders or any(s in st.session_state.excluded_senders for s, _ in top_k):
+    actioned = senders.flagged(ACTIONED)
+    if actioned:
         if st.button("🔄 Refresh Table", use_container_width=True, type="primary"):
-            for s in list(st.session_state.actioned_senders):
-                if s in st.session_state.leaderboard:
-                    del st.session_state.leaderboard[s]
-            st.session_state.actioned_senders = set()
+            for s in actioned:
+                senders.clear_flag(s, ACTIONED)
+                senders.set_flag(s, HIDDEN)
+            save_marks()
             st.rerun() # Full rerun to bring in next 15 from scratch
 
 # Call the function to display it
 render_heavy_hitters()
 
+def deletes_running():
+    return st.session_state.delete_jobs is not None and st.session_state.delete_jobs.active()
+
+# Only polls while jobs run; idle sessions don't rerun anything in the background
+@st.fragment(run_every=2 if deletes_running() else None)
+@timed('render_delete_progress')
+def render_delete_progress():
+    """Live progress of the background delete jobs; polls only this small fragment."""
+    apply_trashed()
+    if not deletes_running():
+        if st.session_state.delete_polling:
+            # The last job just finished: redraw the table with the final counts and stop polling
+            st.session_state.delete_polling = False
+            st.rerun()
+        return
+    st.session_state.delete_polling = True
+    jobs = st.session_state.delete_jobs
+    st.caption("🧹 Cleaning up in the background...")
+    for sender, status, trashed, total, description in jobs.snapshot():
+        if status in ('queued', 'running'):
+            st.progress(trashed / total if total else 0.0, text=f"{sender}: {description}")
+
+render_delete_progress()
+
 # --- 4b. WHITELIST MANAGEMENT ---
-if st.session_state.excluded_senders:
+ignored_senders = st.session_state.senders.flagged(IGNORED)
+if ignored_senders:
     st.divider()
     st.subheader("🗂️ Ignored Senders (Whitelisted)")
     st.caption("These senders are excluded from your 'Heavy Hitters' list. They will not be touched.")
@@ -428,12 +575,14 @@ if st.session_state.excluded_senders:
         w_col1.write("**Sender Email**")
         w_col2.write("**Action**")
         
-        for ignored_sender in sorted(list(st.session_state.excluded_senders)):
+        for ignored_sender in sorted(ignored_senders):
             wi_col1, wi_col2 = st.columns([4, 1])
             wi_col1.write(f"`{ignored_sender}`")
             
             if wi_col2.button("Include Back", key=f"inc_{ignored_sender}", use_container_width=True):
-                st.session_state.excluded_senders.remove(ignored_sender)
+                # Clearing the flag puts it straight back into the ranking with its exact count
+                st.session_state.senders.clear_flag(ignored_sender, IGNORED)
+                save_marks()
                 st.toast(f"Restored {ignored_sender}")
                 time.sleep(0.5)
                 st.rerun()
@@ -452,11 +601,12 @@ with st.expander("🛡️ Privacy Policy & Data Usage"):
     * We **do not** read or store email content.
     
     **2. Data Collection**
-    * **Personal Data:** We do not store names or email addresses.
+    * **Personal Data:** We do not store names or email addresses, except the sender address and size of scanned messages, which are cached on the app server (under your private 'hash' ID) so rescans are fast. Your latest scan results are saved there too, so they are still here after a page refresh.
     * **Usage Data:** We track anonymous activity (scans, deletes, blocks) in a private Google Sheet to improve the app. This is linked to a private 'hash' ID, not your identity.
     
     **3. Your Control**
     * You can revoke access anytime via your Google Account settings.
+    * You can delete the cached scan data anytime with "Clear Cached Scan Data" in the sidebar.
     """)
 
 with st.sidebar:
@@ -465,3 +615,33 @@ with st.sidebar:
     revoke_url = "https://myaccount.google.com/permissions"
     st.link_button("Revoke App Access", revoke_url, use_container_width=True)
     st.caption("This will open your Google Security settings.")
+
+    if st.button("🧹 Clear Cached Scan Data", use_container_width=True):
+        user_id_hash = get_user_id_hash(get_gmail_service())
+        removed = get_metadata_cache().for_account(user_id_hash).purge()
+        snapshot.delete(snapshot.path_for(user_id_hash))
+        st.toast(f"Deleted {removed} cached messages and your saved scan from this server.")
+
+    # Where the time goes: scan phases, Gmail calls per method and reruns, for this server process
+    with st.expander("📈 Performance"):
+        snap = METRICS.snapshot()
+        if snap['phases']:
+            st.dataframe(pd.DataFrame([
+                {"Phase": name, "Runs": p['runs'], "Total s": round(p['seconds'], 2),
+                 "Avg ms": round(1000 * p['seconds'] / p['runs'], 1), "Max ms": round(1000 * p['max_seconds'], 1)}
+                for name, p in sorted(snap['phases'].items(), key=lambda x: -x[1]['seconds'])
+            ]), hide_index=True, use_container_width=True)
+        if snap['api']:
+            st.dataframe(pd.DataFrame([
+                {"Method": method.removeprefix('gmail.users.'), "Calls": a['calls'],
+                 "Avg ms": round(1000 * a['seconds'] / max(a['round_trips'], 1), 1),
+                 "Units": a['units'], "Errors": a['errors'], "Retries": a['retries']}
+                for method, a in sorted(snap['api'].items())
+            ]), hide_index=True, use_container_width=True)
+        d_col1, d_col2 = st.columns(2)
+        d_col1.download_button("JSON", METRICS.to_json(), file_name="metrics.json", mime="application/json",
+                               use_container_width=True)
+        d_col2.download_button("Prometheus", METRICS.to_prometheus(), file_name="metrics.prom",
+                               mime="text/plain", use_container_width=True)
+
+METRICS.add_phase('script_run', time.perf_counter() - script_started)
@@ -1,18 +1,94 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
 import streamlit as st
 import requests
+import httplib2
+import google_auth_httplib2
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
 
 # Same scopes as your Google Console screenshot
 SCOPES = [
     'https://www.googleapis.com/auth/gmail.modify',
     'https://www.googleapis.com/auth/gmail.settings.basic'
 ]
+TOKEN_URL = "https://oauth2.googleapis.com/token"
+HTTP_TIMEOUT = 60                       # seconds, for both Gmail and the token endpoint
+REFRESH_MARGIN = timedelta(minutes=15)  # refresh tokens this close to expiry before long jobs
+
+# Keep-alive session for the token endpoint (code exchange and refreshes)
+token_session = requests.Session()
+# The Gmail discovery document ships with google-api-python-client; parse it once per process
+GMAIL_DISCOVERY = json.loads(discovery_cache.get_static_doc('gmail', 'v1'))
+
+
+class ThreadLocalHttp:
+    """Authorized transport that gives every thread its own persistent httplib2 connection.
+
+    httplib2.Http is not thread-safe, so sharing one service between the scan
+    workers, delete jobs and the UI needs one connection per thread; each is
+    reused for every request that thread makes.
+    """
+
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self._local = threading.local()
+
+    def _http(self):
+        if not hasattr(self._local, 'http'):
+            self._local.http = google_auth_httplib2.AuthorizedHttp(
+                self.credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT)
+            )
+        return self._local.http
+
+    def request(self, *args, **kwargs):
+        return self._http().request(*args, **kwargs)
+
+    def close(self):
+        if hasattr(self._local, 'http'):
+            self._local.http.close()
+
+
+def build_service(creds):
+    """Gmail service on a ThreadLocalHttp transport; one per credential is enough for all threads."""
+    return build_from_document(GMAIL_DISCOVERY, http=ThreadLocalHttp(creds))
+
+
+def refresh_if_expiring(creds):
+    """Refreshes the access token up front if it would expire within REFRESH_MARGIN."""
+    # Service accounts mint new tokens from their key; user credentials need a refresh token
+    refreshable = isinstance(creds, service_account.Credentials) or getattr(creds, 'refresh_token', None)
+    if refreshable and (creds.expiry is None or creds.expiry - datetime.utcnow() < REFRESH_MARGIN):
+        creds.refresh(Request(session=token_session))
+
+
+def load_credentials(path, subject=None):
+    """Credentials from a file, for running without a browser (see cli.py).
+
+    Either an authorized-user token file (client_id, client_secret,
+    refresh_token) or a service-account key with domain-wide delegation,
+    which then acts as `subject`.
+    """
+    with open(path) as f:
+        info = json.load(f)
+    if info.get('type') == 'service_account':
+        if not subject:
+            raise ValueError(f"{path} is a service-account key; say which user it acts as")
+        return service_account.Credentials.from_service_account_info(info, scopes=SCOPES, subject=subject)
+    return Credentials.from_authorized_user_info(info, SCOPES)
+
 
 def get_gmail_service():
-    # 1. If already logged in, just return the service
+    # 1. If already logged in, just return the (cached) service
     if 'google_creds' in st.session_state:
-        return build('gmail', 'v1', credentials=st.session_state.google_creds)
+        if 'gmail_service' not in st.session_state:
+            st.session_state.gmail_service = build_service(st.session_state.google_creds)
+        return st.session_state.gmail_service
 
     # 2. Extract configuration from secrets
     client_config = st.secrets["google_oauth"]["web"]
@@ -40,7 +116,6 @@ def get_gmail_service():
         # STEP B: Manually exchange the code for a token via a POST request
         # This bypasses the "code verifier" error entirely
         try:
-            token_url = "https://oauth2.googleapis.com/token"
             data = {
                 "code": code,
                 "client_id": client_id,
@@ -48,7 +123,7 @@ def get_gmail_service():
                 "redirect_uri": redirect_uri,
                 "grant_type": "authorization_code",
             }
-            response = requests.post(token_url, data=data).json()
+            response = token_session.post(TOKEN_URL, data=data, timeout=HTTP_TIMEOUT).json()
             
             if "error" in response:
                 st.error(f"Auth Error: {response.get('error_description', 'Unknown error')}")
@@ -59,7 +134,8 @@ def get_gmail_service():
             creds = Credentials(
                 token=response["access_token"],
                 refresh_token=response.get("refresh_token"),
-                token_uri=token_url,
+                expiry=datetime.utcnow() + timedelta(seconds=response.get("expires_in", 3600)),
+                token_uri=TOKEN_URL,
                 client_id=client_id,
                 client_secret=client_secret,
                 scopes=SCOPES
@@ -72,3 +148,15 @@ def get_gmail_service():
         except Exception as e:
             st.error(f"Manual Handshake failed: {e}")
             st.stop()
+
+
+def gmail_service_factory():
+    """Returns a callable handing the session's service to worker threads.
+
+    The transport keeps one connection per thread, so all workers can share
+    the cached service. The token is refreshed first if it would otherwise
+    expire in the middle of a long scan or delete job.
+    """
+    service = get_gmail_service()
+    refresh_if_expiring(st.session_state.google_creds)
+    return lambda: service
@@ -0,0 +1,87 @@
+"""Offline scan benchmark against the fake Gmail service.
+
+    python benchmark.py --messages 10000 100000 --workers 1 8 --latency 0.05 --error-rate 0.01
+
+For every mailbox size it reports scan throughput, the API calls and HTTP
+round trips the scan needed, the messages it lost to errors after retries
+and the peak Python memory it allocated. With --cache every scan runs
+twice, cold and then warm from the metadata cache. The fake has no quota of
+its own, so the governor is unlimited unless --quota sets units/second.
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import time
+import tracemalloc
+
+import governor
+import scanner
+from cache import MetadataCache
+from fake_gmail import FakeGmail
+
+
+def bench_scan(n_messages, workers=scanner.WORKERS, latency=0.0, item_latency=0.0, error_rate=0.0, seed=0,
+               cache=None, quota=0, shards=1):
+    """Runs one full scan against a freshly seeded mailbox and returns its stats."""
+    service = FakeGmail(n_messages, latency=latency, item_latency=item_latency,
+                        error_rate=error_rate, seed=seed)
+    governor.register(service, governor.QuotaGovernor(rate=quota or float('inf')))
+    state = scanner.ScanState()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if shards > 1:
+        # Each shard runs `workers` fetch threads of its own
+        listed = scanner.run_sharded_scan(lambda: service, state, shards, workers=workers, cache=cache)
+    else:
+        listed = scanner.run_scan(lambda: service, state, limit=n_messages, workers=workers, cache=cache)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'messages': listed,
+        'seconds': elapsed,
+        'msgs_per_sec': listed / elapsed if elapsed else float('inf'),
+        'api_calls': sum(service.calls.values()),
+        'round_trips': service.round_trips,
+        'lost': listed - len(state.messages),
+        'peak_mb': peak / (1024 * 1024),
+        'senders': len(state.senders),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--workers', type=int, nargs='+', default=[scanner.WORKERS])
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per HTTP round trip")
+    parser.add_argument('--item-latency', type=float, default=0.0, help="seconds per call inside a batch")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="probability of a 429 per call")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1], help="date-range shards scanned in parallel")
+    parser.add_argument('--cache', action='store_true', help="also time a warm rescan from the metadata cache")
+    parser.add_argument('--quota', type=float, default=0, help="governor quota units/second (0: unlimited)")
+    parser.add_argument('--backoff-base', type=float, default=0.05, help="seconds before the first retry")
+    args = parser.parse_args(argv)
+    governor.BACKOFF_BASE = args.backoff_base
+
+    print(f"{'messages':>10} {'workers':>8} {'shards':>7} {'cache':>6} {'msgs/sec':>10} {'api calls':>10} "
+          f"{'round trips':>12} {'lost':>6} {'peak MB':>8} {'senders':>8}")
+    for n in args.messages:
+        for workers, shards in itertools.product(args.workers, args.shards):
+            runs = [('-', None)]
+            if args.cache:
+                tmp = tempfile.mkdtemp()
+                cache = MetadataCache(os.path.join(tmp, 'bench.sqlite3')).for_account('bench')
+                runs = [('cold', cache), ('warm', cache)]
+            for label, cache in runs:
+                r = bench_scan(n, workers, args.latency, args.item_latency, args.error_rate, args.seed, cache,
+                               args.quota, shards)
+                print(f"{r['messages']:>10} {workers:>8} {shards:>7} {label:>6} {r['msgs_per_sec']:>10.0f} {r['api_calls']:>10} "
+                      f"{r['round_trips']:>12} {r['lost']:>6} {r['peak_mb']:>8.1f} {r['senders']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""On-disk cache of per-message scan metadata.
+
+Sender, size and internalDate never change for a Gmail message ID, so once a
+message has been fetched it never needs fetching again, even after the
+Streamlit session is lost or the user resets the app. Rows are keyed by the
+hashed account (st.session_state.user_id_hash), never the address itself.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import METRICS
+
+CACHE_PATH = os.environ.get(
+    'GMAIL_ORGANISER_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'gmail_organiser', 'metadata.sqlite3'),
+)
+MAX_ROWS = 2_000_000  # across all accounts; the oldest rows are evicted beyond this
+EVICT_SLACK = 0.1     # evict this fraction below MAX_ROWS so eviction runs rarely
+LOOKUP_CHUNK = 500    # IDs per SELECT, well under SQLite's bound-parameter limit
+
+
+class MetadataCache:
+    """SQLite table of (account, message id) -> (sender, size, internal_date)."""
+
+    def __init__(self, path=CACHE_PATH, max_rows=MAX_ROWS):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                account TEXT NOT NULL,
+                id TEXT NOT NULL,
+                sender TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                internal_date INTEGER NOT NULL,
+                cached_at INTEGER NOT NULL,
+                PRIMARY KEY (account, id)
+            )
+        """)
+        self._rows = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def for_account(self, account_hash):
+        return AccountCache(self, account_hash)
+
+    def get_many(self, account_hash, message_ids):
+        """Cached records {id: (id, sender, size, internal_date)} for the IDs we have."""
+        found = {}
+        with METRICS.phase('cache_read'), self._lock:
+            for i in range(0, len(message_ids), LOOKUP_CHUNK):
+                chunk = message_ids[i : i + LOOKUP_CHUNK]
+                rows = self._db.execute(
+                    f"SELECT id, sender, size, internal_date FROM messages "
+                    f"WHERE account = ? AND id IN ({','.join('?' * len(chunk))})",
+                    [account_hash, *chunk],
+                )
+                for row in rows:
+                    found[row[0]] = row
+        return found
+
+    def put_many(self, account_hash, records):
+        """Stores (id, sender, size, internal_date) records, evicting old rows if over budget."""
+        now = int(time.time())
+        with METRICS.phase('cache_write'), self._lock, self._db:
+            cursor = self._db.executemany(
+                "INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?, ?)",
+                [(account_hash, msg_id, sender, size, internal_date, now)
+                 for msg_id, sender, size, internal_date in records],
+            )
+            self._rows += max(cursor.rowcount, 0)
+            if self._rows > self.max_rows:
+                keep = int(self.max_rows * (1 - EVICT_SLACK))
+                self._db.execute(
+                    "DELETE FROM messages WHERE rowid IN "
+                    "(SELECT rowid FROM messages ORDER BY cached_at, rowid LIMIT ?)",
+                    (self._rows - keep,),
+                )
+                self._rows = keep
+
+    def purge(self, account_hash):
+        """Deletes everything cached for one account. Returns the number of rows removed."""
+        with self._lock, self._db:
+            removed = self._db.execute("DELETE FROM messages WHERE account = ?", (account_hash,)).rowcount
+            self._rows -= removed
+        return removed
+
+
+class AccountCache:
+    """MetadataCache bound to one account, which is what the scanner takes."""
+
+    def __init__(self, cache, account_hash):
+        self.cache = cache
+        self.account_hash = account_hash
+
+    def get_many(self, message_ids):
+        return self.cache.get_many(self.account_hash, message_ids)
+
+    def put_many(self, records):
+        self.cache.put_many(self.account_hash, records)
+
+    def purge(self):
+        return self.cache.purge(self.account_hash)
@@ -0,0 +1,161 @@
+"""Headless scans for cron: many accounts, no browser and no Streamlit session.
+
+    python cli.py token.json alice@corp.com=service-account.json --out reports --format parquet
+
+Each ACCOUNT is an authorized-user token file, or SUBJECT=KEYFILE for a
+service-account key with domain-wide delegation acting as SUBJECT. Accounts
+are scanned concurrently, up to --parallel at a time, with the same scan
+engine, metadata cache and quota governor as the app, and each one gets a
+heavy-hitter report <out>/<address>.<format>. With --trash-top N the N
+heaviest senders' messages are also moved to the trash, like the Delete
+button does.
+
+Exit status: 0 every account scanned, 1 some accounts failed, 2 bad usage,
+3 every account failed.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import scanner
+from auth import build_service, load_credentials, refresh_if_expiring
+from cache import CACHE_PATH, MetadataCache
+from governor import QuotaGovernor, governor_for, register
+from jobs import DeleteJobs
+from senders import normalize_sender
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+EXIT_FAILED = 3
+PARALLEL_ACCOUNTS = 4  # accounts scanned at once, each with its own scan threads
+REPORT_TOP = 100       # senders per report
+POLL_INTERVAL = 0.5    # seconds between delete job status checks
+
+
+def open_account(spec):
+    """Gmail service for one ACCOUNT argument: TOKENFILE or SUBJECT=KEYFILE."""
+    subject, _, path = spec.rpartition('=')
+    creds = load_credentials(path, subject or None)
+    refresh_if_expiring(creds)
+    return build_service(creds)
+
+
+def heavy_hitters(state, n, exclude=(), by='count'):
+    """The n heaviest senders of a finished scan, by message count or bytes, as a report table."""
+    top = [(sender, scanner.sender_count(state, sender))
+           for sender, _ in scanner.top_senders(state, n, exclude=exclude, by=by)]
+    return pd.DataFrame({
+        'rank': range(1, len(top) + 1),
+        'sender': [sender for sender, _ in top],
+        'messages': [count for _, count in top],
+        'bytes': [state.senders.size(sender) for sender, _ in top],
+    })
+
+
+def trash_senders(service, state, senders):
+    """Trashes every scanned message from senders; returns how many were trashed."""
+    jobs = DeleteJobs(lambda: service)
+    for sender in senders:
+        # Same rule as the app: scan IDs when the scan covered the whole inbox, else a from: search
+        jobs.submit(sender, state.sender_messages.get(sender) if state.scan_complete else None)
+    while jobs.active():
+        time.sleep(POLL_INTERVAL)
+    failed = [(sender, description) for sender, status, _, _, description in jobs.snapshot() if status == 'failed']
+    if failed:
+        raise RuntimeError("; ".join(f"{sender}: {description}" for sender, description in failed))
+    return sum(trashed for _, _, trashed, _, _ in jobs.snapshot())
+
+
+def run_account(service, args, cache=None):
+    """Scans one account, writes its report and optionally trashes its top senders."""
+    profile = governor_for(service).execute(service.users().getProfile(userId='me'))
+    address = profile['emailAddress']
+    # Same privacy-safe key the app files cache rows under, so both reuse each other's fetches
+    account_hash = hashlib.sha256(address.encode()).hexdigest()
+    state = scanner.ScanState()
+    start = time.perf_counter()
+    _, listed = scanner.scan_inbox(lambda: service, state, limit=args.limit, shards=args.shards,
+                                   cache=cache.for_account(account_hash) if cache else None)
+    seconds = time.perf_counter() - start
+
+    # Same canonical keys as the scan, so "Acme <News@acme.com>" keeps news@acme.com
+    report = heavy_hitters(state, args.top, exclude={normalize_sender(sender) for sender in args.keep}, by=args.by)
+    trashed = 0
+    if args.trash_top:
+        trashed = trash_senders(service, state, list(report['sender'][:args.trash_top]))
+    path = os.path.join(args.out, f"{address}.{args.format}")
+    if args.format == 'parquet':
+        report.to_parquet(path, index=False)
+    else:
+        report.to_csv(path, index=False)
+    return {'account': address, 'messages': listed, 'senders': len(state.senders),
+            'seconds': seconds, 'trashed': trashed, 'report': path}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('accounts', nargs='+', metavar='ACCOUNT', help="TOKENFILE or SUBJECT=KEYFILE")
+    parser.add_argument('--out', default='reports', help="directory for the per-account reports")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--top', type=int, default=REPORT_TOP, help="senders per report")
+    parser.add_argument('--by', choices=['count', 'size'], default='count',
+                        help="rank senders by messages or by bytes reclaimable")
+    parser.add_argument('--parallel', type=int, default=PARALLEL_ACCOUNTS, help="accounts scanned at once")
+    parser.add_argument('--limit', type=int, default=None, help="messages per scan (default: the whole inbox)")
+    parser.add_argument('--shards', type=int, default=1,
+                        help="date-range shards per scan; only faster with quota to spare (e.g. --fake)")
+    parser.add_argument('--keep', nargs='*', default=[], metavar='SENDER', help="senders left out of reports")
+    parser.add_argument('--trash-top', type=int, default=0, metavar='N',
+                        help="also move the N heaviest senders' messages to the trash")
+    parser.add_argument('--cache', default=CACHE_PATH, help="metadata cache file")
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--fake', type=int, default=0, metavar='MESSAGES',
+                        help="scan synthetic mailboxes of this size instead, one per ACCOUNT name")
+    parser.add_argument('--quota', type=float, default=0,
+                        help="with --fake, governor quota units/second (default: unlimited)")
+    args = parser.parse_args(argv)
+
+    if args.format == 'parquet':
+        try:
+            pd.io.parquet.get_engine('auto')
+        except ImportError as e:
+            parser.exit(EXIT_USAGE, f"{parser.prog}: error: {e}\n")
+    os.makedirs(args.out, exist_ok=True)
+    cache = None if args.no_cache else MetadataCache(args.cache)
+
+    def run(index, spec):
+        try:
+            if args.fake:
+                from fake_gmail import FakeGmail
+                service = FakeGmail(args.fake, seed=index, email_address=spec)
+                # The fake has no quota of its own; only throttle it when asked to
+                register(service, QuotaGovernor(rate=args.quota or float('inf')))
+            else:
+                service = open_account(spec)
+            return run_account(service, args, cache)
+        except Exception as e:
+            print(f"{spec}: {type(e).__name__}: {e}", file=sys.stderr)
+            return None
+
+    with ThreadPoolExecutor(max_workers=args.parallel, thread_name_prefix='account') as pool:
+        results = list(pool.map(run, range(len(args.accounts)), args.accounts))
+
+    print(f"{'account':<32} {'messages':>9} {'senders':>8} {'seconds':>8} {'trashed':>8}  report")
+    for result in results:
+        if result is not None:
+            print(f"{result['account']:<32} {result['messages']:>9} {result['senders']:>8} "
+                  f"{result['seconds']:>8.1f} {result['trashed']:>8}  {result['report']}")
+    failed = sum(result is None for result in results)
+    if failed == len(results):
+        return EXIT_FAILED
+    return EXIT_PARTIAL if failed else EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
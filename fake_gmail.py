@@ -0,0 +1,408 @@
+"""Offline stand-in for the parts of the Gmail API the app uses.
+
+FakeGmail mimics a googleapiclient service object closely enough for the scan
+engine: users().getProfile(), users().history().list(), users().messages()
+list/get/batchModify, users().settings().filters() list/create/delete and
+new_batch_http_request(). The mailbox is seeded with synthetic messages held
+in NumPy arrays, so a million messages fit comfortably in memory, and every
+HTTP round trip can be slowed down or throttled with a 429 on demand. deliver(), expunge() and expire_history() simulate mailbox
+activity between scans.
+"""
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httplib2
+import numpy as np
+from googleapiclient.errors import HttpError
+
+LIST_MAX_RESULTS = 500      # Gmail silently caps messages().list and history().list pages at 500
+BATCH_MODIFY_MAX_IDS = 1000
+MAX_FILTERS = 1000          # Gmail's per-account filter limit
+NOW_MS = 1_760_000_000_000  # fixed "now" so seeded mailboxes are reproducible
+SPAN_MS = 5 * 365 * 24 * 3600 * 1000
+
+_TERM = re.compile(r'(-?)(\w+):(\([^)]*\)|\S+)')
+
+
+def _http_error(status, reason, uri):
+    resp = httplib2.Response({'status': status, 'reason': reason})
+    content = json.dumps({'error': {'code': status, 'message': reason}}).encode()
+    return HttpError(resp, content, uri=uri)
+
+
+def _parse_size(value):
+    units = {'k': 1024, 'm': 1024 * 1024}
+    value = value.lower()
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _parse_date_ms(value):
+    if value.isdigit():
+        return int(value) * 1000
+    day = datetime.strptime(value.replace('-', '/'), "%Y/%m/%d").replace(tzinfo=timezone.utc)
+    return int(day.timestamp() * 1000)
+
+
+class FakeRequest:
+    """A single API call; execute() costs one HTTP round trip."""
+
+    def __init__(self, gmail, method, fn):
+        self.gmail = gmail
+        self.method = method
+        self.methodId = f"gmail.users.{method}"  # as on googleapiclient.http.HttpRequest
+        self.fn = fn
+
+    def run(self):
+        self.gmail._count(self.method)
+        self.gmail._maybe_throttle(self.method)
+        return self.fn()
+
+    def execute(self, num_retries=0):
+        self.gmail._round_trip(1)
+        return self.run()
+
+
+class FakeBatch:
+    """Mirrors googleapiclient.http.BatchHttpRequest: one round trip, per-part errors."""
+
+    def __init__(self, gmail, callback=None):
+        self.gmail = gmail
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if request_id is None:
+            request_id = str(len(self.requests) + 1)
+        self.requests.append((request_id, request, callback))
+
+    def execute(self):
+        self.gmail._round_trip(len(self.requests))
+        for request_id, request, callback in self.requests:
+            response, exception = None, None
+            try:
+                response = request.run()
+            except HttpError as e:
+                exception = e
+            if callback is not None:
+                callback(request_id, response, exception)
+            if self.callback is not None:
+                self.callback(request_id, response, exception)
+
+
+class _Messages:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId='me', q=None, maxResults=100, pageToken=None, includeSpamTrash=False):
+        return FakeRequest(self.gmail, 'messages.list',
+                           lambda: self.gmail._list(q, maxResults, pageToken, includeSpamTrash))
+
+    def get(self, userId='me', id=None, format='full', metadataHeaders=None):
+        return FakeRequest(self.gmail, 'messages.get', lambda: self.gmail._get(id))
+
+    def batchModify(self, userId='me', body=None):
+        return FakeRequest(self.gmail, 'messages.batchModify',
+                           lambda: self.gmail._batch_modify(body or {}))
+
+
+class _History:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId='me', startHistoryId=None, historyTypes=None, maxResults=100, pageToken=None):
+        return FakeRequest(self.gmail, 'history.list',
+                           lambda: self.gmail._history_list(startHistoryId, maxResults, pageToken))
+
+
+class _Filters:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId='me'):
+        return FakeRequest(self.gmail, 'settings.filters.list',
+                           lambda: {'filter': [dict(f) for f in self.gmail.filters]} if self.gmail.filters else {})
+
+    def create(self, userId='me', body=None):
+        return FakeRequest(self.gmail, 'settings.filters.create', lambda: self.gmail._create_filter(body))
+
+    def delete(self, userId='me', id=None):
+        return FakeRequest(self.gmail, 'settings.filters.delete', lambda: self.gmail._delete_filter(id))
+
+
+class _Settings:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def filters(self):
+        return _Filters(self.gmail)
+
+
+class _Users:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def messages(self):
+        return _Messages(self.gmail)
+
+    def history(self):
+        return _History(self.gmail)
+
+    def settings(self):
+        return _Settings(self.gmail)
+
+    def getProfile(self, userId='me'):
+        return FakeRequest(self.gmail, 'getProfile', self.gmail._profile)
+
+
+class FakeGmail:
+    """Synthetic mailbox behind a googleapiclient-shaped interface.
+
+    Senders follow a Zipf-like popularity curve and each sender appears under a
+    few different From-header spellings, like real newsletters do. `latency`
+    is paid once per HTTP round trip (a batch is one round trip) and
+    `item_latency` once per call inside it; `error_rate` is the probability
+    that any single call comes back as a 429.
+    """
+
+    def __init__(self, n_messages=10000, n_senders=None, latency=0.0, item_latency=0.0,
+                 error_rate=0.0, seed=0, email_address='me@example.com'):
+        self.latency = latency
+        self.item_latency = item_latency
+        self.error_rate = error_rate
+        self.email_address = email_address
+        self.calls = Counter()
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._index_cache = {}
+
+        rng = np.random.default_rng(seed)
+        n_senders = n_senders or max(10, n_messages // 20)
+        popularity = 1.0 / np.arange(1, n_senders + 1) ** 1.1
+        self.addresses = [f"news{k}@sender{k % 97}.example.com" for k in range(n_senders)]
+        self._address_index = {a: k for k, a in enumerate(self.addresses)}
+        self._sender = rng.choice(n_senders, size=n_messages, p=popularity / popularity.sum()).astype(np.int32)
+        self._variant = rng.integers(0, 3, size=n_messages, dtype=np.int8)
+        typical_size = rng.lognormal(mean=10.0, sigma=1.5, size=n_senders)
+        self._size = (typical_size[self._sender] * rng.lognormal(0.0, 0.5, n_messages)).astype(np.int64) + 1000
+        self._date = NOW_MS - np.sort(rng.integers(0, SPAN_MS, size=n_messages))
+        self._inbox = rng.random(n_messages) < 0.95
+        self._trash = np.zeros(n_messages, dtype=bool)
+        self._deleted = np.zeros(n_messages, dtype=bool)
+        self._rng = rng
+        self._history = []        # (history_id, change, message index, label_ids)
+        self._history_id = 1000
+        self._history_floor = 0   # startHistoryIds below this have "expired"
+        self.filters = []
+
+    # --- googleapiclient surface ---
+    def users(self):
+        return _Users(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    # --- bookkeeping ---
+    def _count(self, method):
+        with self._lock:
+            self.calls[method] += 1
+
+    def _round_trip(self, n_calls):
+        with self._lock:
+            self.round_trips += 1
+        delay = self.latency + self.item_latency * n_calls
+        if delay:
+            time.sleep(delay)
+
+    def _maybe_throttle(self, method):
+        if not self.error_rate:
+            return
+        with self._lock:
+            throttled = self._random.random() < self.error_rate
+        if throttled:
+            raise _http_error(429, 'Too many concurrent requests for user', method)
+
+    def header(self, i):
+        """From header of message i, in one of the sender's spellings."""
+        k = int(self._sender[i])
+        address = self.addresses[k]
+        return (f"Sender {k} <{address}>", f"SENDER {k} News <{address}>", address)[self._variant[i]]
+
+    # --- query evaluation ---
+    def _term_mask(self, op, value):
+        if op in ('label', 'in'):
+            flags = {'inbox': self._inbox, 'trash': self._trash}
+            if value.lower() == 'anywhere':
+                return np.ones(len(self._sender), dtype=bool)
+            return flags.get(value.lower(), np.zeros(len(self._sender), dtype=bool))
+        if op == 'from':
+            wanted = []
+            for part in re.split(r'\s+OR\s+', value.strip('()'), flags=re.IGNORECASE):
+                part = part.strip().strip('"').lower()
+                if '<' in part:
+                    part = part[part.index('<') + 1:].rstrip('>')
+                if part in self._address_index:
+                    wanted.append(self._address_index[part])
+                elif part:
+                    wanted.extend(k for k, a in enumerate(self.addresses) if part in a)
+            return np.isin(self._sender, wanted)
+        if op == 'after':
+            return self._date >= _parse_date_ms(value)
+        if op == 'before':
+            return self._date < _parse_date_ms(value)
+        if op == 'larger':
+            return self._size > _parse_size(value)
+        if op == 'smaller':
+            return self._size < _parse_size(value)
+        raise ValueError(f"FakeGmail does not understand the search operator {op}:")
+
+    def _matching(self, q, include_spam_trash):
+        key = (q, include_spam_trash)
+        if key not in self._index_cache:
+            mask = np.ones(len(self._sender), dtype=bool)
+            for negate, op, value in _TERM.findall(q or ''):
+                term = self._term_mask(op.lower(), value)
+                mask &= ~term if negate else term
+            if not include_spam_trash:
+                mask &= ~self._trash
+            mask &= ~self._deleted
+            if len(self._index_cache) > 64:
+                self._index_cache.clear()
+            self._index_cache[key] = np.flatnonzero(mask)
+        return self._index_cache[key]
+
+    # --- endpoint implementations ---
+    def _list(self, q, max_results, page_token, include_spam_trash):
+        with self._lock:
+            matching = self._matching(q, include_spam_trash)
+        start = int(page_token or 0)
+        page = matching[start:start + min(max_results, LIST_MAX_RESULTS)]
+        result = {'resultSizeEstimate': int(len(matching))}
+        if len(page):
+            result['messages'] = [{'id': f"{i:016x}", 'threadId': f"{i:016x}"} for i in page]
+        if start + len(page) < len(matching):
+            result['nextPageToken'] = str(start + len(page))
+        return result
+
+    def _labels(self, i):
+        labels = ['INBOX'] if self._inbox[i] else []
+        return labels + (['TRASH'] if self._trash[i] else [])
+
+    def _get(self, msg_id):
+        i = int(msg_id, 16)
+        if i >= len(self._sender) or self._deleted[i]:
+            raise _http_error(404, 'Requested entity was not found.', 'messages.get')
+        return {
+            'id': msg_id,
+            'threadId': msg_id,
+            'labelIds': self._labels(i),
+            'sizeEstimate': int(self._size[i]),
+            'internalDate': str(int(self._date[i])),
+            'payload': {'headers': [{'name': 'From', 'value': self.header(i)}]},
+        }
+
+    def _batch_modify(self, body):
+        ids = body.get('ids', [])
+        if len(ids) > BATCH_MODIFY_MAX_IDS:
+            raise _http_error(400, 'Too many messages in batchModify', 'messages.batchModify')
+        rows = np.array([int(i, 16) for i in ids], dtype=np.int64)
+        with self._lock:
+            for label, flags in (('INBOX', self._inbox), ('TRASH', self._trash)):
+                for change, value, key in (('labelsAdded', True, 'addLabelIds'),
+                                           ('labelsRemoved', False, 'removeLabelIds')):
+                    if label in body.get(key, []):
+                        changed = rows[flags[rows] != value]
+                        flags[changed] = value
+                        self._record(change, changed, [label])
+            self._index_cache.clear()
+        return {}
+
+    def _record(self, change, rows, label_ids=None):
+        for i in rows:
+            self._history_id += 1
+            self._history.append((self._history_id, change, int(i), label_ids))
+
+    def _history_list(self, start_history_id, max_results, page_token):
+        start = int(start_history_id)
+        if start < self._history_floor:
+            raise _http_error(404, 'Requested entity was not found.', 'history.list')
+        with self._lock:
+            records = [h for h in self._history if h[0] > start]
+            offset = int(page_token or 0)
+            page = records[offset:offset + min(max_results, LIST_MAX_RESULTS)]
+            history = []
+            for history_id, change, i, label_ids in page:
+                message = {'id': f"{i:016x}", 'threadId': f"{i:016x}", 'labelIds': self._labels(i)}
+                item = {'message': message}
+                if label_ids is not None:
+                    item['labelIds'] = label_ids
+                history.append({'id': str(history_id), 'messages': [message], change: [item]})
+            result = {'historyId': str(self._history_id)}
+            if history:
+                result['history'] = history
+            if offset + len(page) < len(records):
+                result['nextPageToken'] = str(offset + len(page))
+        return result
+
+    def _create_filter(self, body):
+        with self._lock:
+            if len(self.filters) >= MAX_FILTERS:
+                raise _http_error(400, 'Too many filters', 'settings.filters.create')
+            created = dict(body, id=f"filter{len(self.filters)}-{self._history_id}")
+            self._history_id += 1
+            self.filters.append(created)
+        return created
+
+    def _delete_filter(self, filter_id):
+        with self._lock:
+            if not any(f['id'] == filter_id for f in self.filters):
+                raise _http_error(404, 'Filter not found', 'settings.filters.delete')
+            self.filters = [f for f in self.filters if f['id'] != filter_id]
+        return ''
+
+    # --- simulated mailbox activity (not part of the Gmail API) ---
+    def deliver(self, n_messages, senders=None):
+        """Simulates n new inbox messages arriving; returns their IDs."""
+        with self._lock:
+            n_senders = len(self.addresses)
+            senders = self._rng.integers(0, n_senders, size=n_messages) if senders is None else np.asarray(senders)
+            start = len(self._sender)
+            self._sender = np.concatenate([self._sender, senders.astype(np.int32)])
+            self._variant = np.concatenate([self._variant, np.zeros(n_messages, dtype=np.int8)])
+            self._size = np.concatenate([self._size, self._rng.integers(2000, 200000, size=n_messages)])
+            self._date = np.concatenate([self._date, NOW_MS + np.arange(1, n_messages + 1)])
+            self._inbox = np.concatenate([self._inbox, np.ones(n_messages, dtype=bool)])
+            self._trash = np.concatenate([self._trash, np.zeros(n_messages, dtype=bool)])
+            self._deleted = np.concatenate([self._deleted, np.zeros(n_messages, dtype=bool)])
+            rows = np.arange(start, start + n_messages)
+            self._record('messagesAdded', rows)
+            self._index_cache.clear()
+        return [f"{i:016x}" for i in rows]
+
+    def expunge(self, ids):
+        """Simulates permanent deletion (e.g. emptying the trash)."""
+        with self._lock:
+            rows = np.array([int(i, 16) for i in ids], dtype=np.int64)
+            self._deleted[rows] = True
+            self._record('messagesDeleted', rows)
+            self._index_cache.clear()
+
+    def expire_history(self):
+        """Makes every historyId handed out so far too old for history().list."""
+        with self._lock:
+            self._history_floor = self._history_id + 1
+
+    def _profile(self):
+        return {
+            'emailAddress': self.email_address,
+            'messagesTotal': int(len(self._sender)),
+            'threadsTotal': int(len(self._sender)),
+            'historyId': str(self._history_id),
+        }
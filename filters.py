@@ -0,0 +1,107 @@
+"""Auto-trash Gmail filters for blocked senders.
+
+Gmail caps the number of filters per account, so blocked senders are packed
+into as few `from:(a OR b OR c)` filters as the criteria length limit
+allows. The account's filter list is fetched once per session and kept in
+sync locally, and senders an existing from-only trash filter already covers
+are skipped.
+"""
+import re
+
+from governor import governor_for
+
+MAX_CRITERIA_CHARS = 1500  # Gmail rejects filter criteria much longer than this
+TRASH_ACTION = {'addLabelIds': ['TRASH'], 'removeLabelIds': ['INBOX']}
+
+_SEPARATORS = re.compile(r'[\s{}()"|,]+')
+
+
+def senders_in(criteria_from):
+    """The individual senders named in a filter's `from` criteria (a OR b, {a b}, a | b)."""
+    return {part.lower() for part in _SEPARATORS.split(criteria_from or '') if part and part.upper() != 'OR'}
+
+
+def is_trash_filter(gmail_filter):
+    return 'TRASH' in gmail_filter.get('action', {}).get('addLabelIds', [])
+
+
+def is_block_filter(gmail_filter):
+    """A filter that trashes everything from its senders: from-only criteria with the trash action."""
+    return is_trash_filter(gmail_filter) and set(gmail_filter.get('criteria', {})) == {'from'}
+
+
+def is_foldable(gmail_filter):
+    """Shaped exactly like the filters block() creates, so recreating it with more senders loses nothing.
+
+    A from-only trash filter that also forwards, labels or marks mail is the
+    user's own and is never folded, or those actions would be dropped.
+    """
+    action = {key: sorted(value) if isinstance(value, list) else value
+              for key, value in gmail_filter.get('action', {}).items()}
+    return is_block_filter(gmail_filter) and action == {key: sorted(value) for key, value in TRASH_ACTION.items()}
+
+
+def pack_senders(senders, max_chars=MAX_CRITERIA_CHARS):
+    """Groups senders into ' OR '-joined criteria strings of at most max_chars."""
+    groups, current = [], []
+    for sender in senders:
+        if current and len(' OR '.join(current + [sender])) > max_chars:
+            groups.append(' OR '.join(current))
+            current = []
+        current.append(sender)
+    if current:
+        groups.append(' OR '.join(current))
+    return groups
+
+
+class FilterManager:
+    """Session-cached inventory of the account's filters, plus senders waiting to be blocked."""
+
+    def __init__(self):
+        self.filters = None  # filters().list result, loaded on first use
+        self.pending = set()
+
+    def load(self, service):
+        if self.filters is None:
+            result = governor_for(service).execute(service.users().settings().filters().list(userId='me'))
+            self.filters = result.get('filter', [])
+        return self.filters
+
+    def blocked_senders(self, service):
+        """Senders whose mail is already trashed whatever it says; a filter with extra criteria doesn't count."""
+        covered = set()
+        for gmail_filter in self.load(service):
+            if is_block_filter(gmail_filter):
+                covered |= senders_in(gmail_filter.get('criteria', {}).get('from'))
+        return covered
+
+    def block(self, service, senders):
+        """Creates the fewest filters that trash mail from senders.
+
+        The last foldable block filter with room left is folded into the new
+        ones (created first, then the old one deleted), so repeated blocking
+        doesn't use up a filter slot per batch. Returns (created, skipped).
+        """
+        covered = self.blocked_senders(service)
+        new = sorted({s.lower() for s in senders} - covered)
+        skipped = len(set(s.lower() for s in senders)) - len(new)
+        if not new:
+            return 0, skipped
+
+        filters = self.filters
+        roomy = next((f for f in reversed(filters) if is_foldable(f)
+                      and len(f['criteria']['from']) + len(' OR '.join(new)) + 4 <= MAX_CRITERIA_CHARS), None)
+        if roomy is not None:
+            new = sorted(senders_in(roomy['criteria']['from'])) + new
+
+        created = 0
+        for criteria_from in pack_senders(new):
+            body = {'criteria': {'from': criteria_from}, 'action': TRASH_ACTION}
+            filters.append(governor_for(service).execute(
+                service.users().settings().filters().create(userId='me', body=body)
+            ))
+            created += 1
+        if roomy is not None:
+            governor_for(service).execute(service.users().settings().filters().delete(userId='me', id=roomy['id']))
+            filters.remove(roomy)
+        return created, skipped
@@ -0,0 +1,230 @@
+"""Quota-aware request governor shared by every Gmail call path.
+
+Gmail meters each user in quota units (messages.get and messages.list cost
+5, batchModify 50, ...) against a per-user rate of 250 units/second. All
+scan, verification, delete and filter calls for one service go through the
+same QuotaGovernor. It charges each call's cost to a token bucket and
+retries throttled or failed calls, including individual parts of an HTTP
+batch, with jittered backoff. It also adapts the request rate, batch size
+and worker concurrency to the throttling it sees (additive increase,
+multiplicative decrease), so the scan runs as fast as the quota allows
+without dropping messages. Every call's latency, quota units, errors and
+retries are recorded in metrics.METRICS, as is the time spent waiting for quota.
+"""
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from googleapiclient.errors import HttpError
+
+from metrics import METRICS
+
+USER_QUOTA_PER_SEC = 250  # Gmail per-user quota units per second
+METHOD_COSTS = {
+    'gmail.users.getProfile': 1,
+    'gmail.users.history.list': 2,
+    'gmail.users.messages.get': 5,
+    'gmail.users.messages.list': 5,
+    'gmail.users.messages.batchModify': 50,
+    'gmail.users.settings.filters.list': 1,
+    'gmail.users.settings.filters.create': 5,
+    'gmail.users.settings.filters.delete': 5,
+}
+DEFAULT_COST = 5
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0        # seconds, doubled per retry with jitter
+BACKOFF_CAP = 32.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+TRANSPORT_ERRORS = (TimeoutError, ConnectionError)  # socket timeouts and resets, worth another try
+MIN_RATE = 25             # never throttle ourselves below this many units/second
+MAX_BATCH_SIZE = 50       # Gmail's recommended ceiling for batched gets
+MIN_BATCH_SIZE = 10
+MAX_CONCURRENCY = 8
+RECOVERY_STREAK = 20      # successful calls before batch size / concurrency grow again
+
+_governors = weakref.WeakKeyDictionary()
+_governors_lock = threading.Lock()
+
+
+def governor_for(service):
+    """The QuotaGovernor shared by every caller of this service object."""
+    with _governors_lock:
+        governor = _governors.get(service)
+        if governor is None:
+            governor = _governors[service] = QuotaGovernor()
+        return governor
+
+
+def register(service, governor):
+    """Uses a specifically configured governor for service (e.g. a different quota)."""
+    with _governors_lock:
+        _governors[service] = governor
+
+
+def method_of(request):
+    return getattr(request, 'methodId', None) or 'unknown'
+
+
+def cost_of(request):
+    return METHOD_COSTS.get(getattr(request, 'methodId', None), DEFAULT_COST)
+
+
+def is_rate_limit(exception):
+    """429s, and the 403 rateLimitExceeded / userRateLimitExceeded Gmail also sends."""
+    if not isinstance(exception, HttpError):
+        return False
+    return exception.resp.status == 429 or (
+        exception.resp.status == 403 and b'ateLimitExceeded' in (exception.content or b'')
+    )
+
+
+def is_retryable(exception):
+    if isinstance(exception, TRANSPORT_ERRORS):
+        return True
+    return isinstance(exception, HttpError) and (exception.resp.status in RETRY_STATUSES or is_rate_limit(exception))
+
+
+def backoff(attempt):
+    return min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class QuotaGovernor:
+    """Token bucket over quota units plus adaptive batch size and concurrency."""
+
+    def __init__(self, rate=USER_QUOTA_PER_SEC, batch_size=MAX_BATCH_SIZE, concurrency=MAX_CONCURRENCY):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = rate
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.throttled = 0
+        self.retried = 0
+        self._tokens = float(rate)
+        self._last = time.monotonic()
+        self._active = 0
+        self._streak = 0
+        self._cond = threading.Condition()
+
+    # --- rate and concurrency ---
+    def acquire(self, units):
+        """Blocks until `units` quota units are available. A call larger than the
+        bucket is let through once it is full, leaving the bucket in debt."""
+        start = time.perf_counter()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= min(units, self.burst):
+                    self._tokens -= units
+                    break
+                self._cond.wait((min(units, self.burst) - self._tokens) / self.rate)
+        METRICS.add_phase('quota_wait', time.perf_counter() - start)
+
+    @contextmanager
+    def slot(self):
+        """Limits how many batches run at once to the current concurrency."""
+        with self._cond:
+            while self._active >= self.concurrency:
+                self._cond.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def _on_success(self):
+        with self._cond:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+            self._streak += 1
+            if self._streak >= RECOVERY_STREAK:
+                self._streak = 0
+                self.batch_size = min(MAX_BATCH_SIZE, self.batch_size + 5)
+                self.concurrency = min(MAX_CONCURRENCY, self.concurrency + 1)
+                self._cond.notify_all()
+
+    def _on_throttled(self):
+        with self._cond:
+            self.throttled += 1
+            self._streak = 0
+            self.rate = max(MIN_RATE, self.rate / 2)
+            self.batch_size = max(MIN_BATCH_SIZE, self.batch_size // 2)
+            self.concurrency = max(1, self.concurrency - 1)
+            self._tokens = min(self._tokens, 0.0)  # drain the burst so everyone slows down now
+
+    # --- execution ---
+    def execute(self, request, retries=MAX_RETRIES):
+        """request.execute() within quota, retrying 429/5xx with jittered backoff."""
+        for attempt in range(retries + 1):
+            units = cost_of(request)
+            self.acquire(units)
+            start = time.perf_counter()
+            try:
+                result = request.execute()
+            except (HttpError, *TRANSPORT_ERRORS) as e:
+                METRICS.observe_call(method_of(request), time.perf_counter() - start, units=units, errors=1,
+                                     retries=int(attempt > 0))
+                if not is_retryable(e) or attempt == retries:
+                    raise
+                if is_rate_limit(e):
+                    self._on_throttled()
+                self.retried += 1
+                time.sleep(backoff(attempt))
+                continue
+            METRICS.observe_call(method_of(request), time.perf_counter() - start, units=units,
+                                 retries=int(attempt > 0))
+            self._on_success()
+            return result
+
+    def execute_batch(self, service, requests, retries=MAX_RETRIES):
+        """Runs requests as one HTTP batch; returns (response, exception) per request, in order.
+
+        Parts that fail with a retryable error are sent again in a new batch
+        after a backoff, so a 429 on one message doesn't lose it. The batch
+        POST itself is retried the same way when it fails as a whole.
+        """
+        results = [(None, None)] * len(requests)
+        pending = list(range(len(requests)))
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        for attempt in range(retries + 1):
+            units = sum(cost_of(requests[i]) for i in pending)
+            self.acquire(units)
+            batch = service.new_batch_http_request(callback=callback)
+            for i in pending:
+                batch.add(requests[i], request_id=str(i))
+            start = time.perf_counter()
+            try:
+                batch.execute()
+            except (HttpError, *TRANSPORT_ERRORS) as e:
+                METRICS.observe_call(method_of(requests[pending[0]]), time.perf_counter() - start,
+                                     calls=len(pending), units=units, errors=len(pending),
+                                     retries=len(pending) if attempt else 0)
+                if not is_retryable(e) or attempt == retries:
+                    raise
+                if is_rate_limit(e):
+                    self._on_throttled()
+                self.retried += len(pending)
+                time.sleep(backoff(attempt))
+                continue
+            METRICS.observe_call(method_of(requests[pending[0]]), time.perf_counter() - start, calls=len(pending),
+                                 units=units, errors=sum(results[i][1] is not None for i in pending),
+                                 retries=len(pending) if attempt else 0)
+            failed = [i for i in pending if is_retryable(results[i][1])]
+            if not failed:
+                self._on_success()
+                break
+            if attempt == retries:
+                break
+            if any(is_rate_limit(results[i][1]) for i in failed):
+                self._on_throttled()
+            self.retried += len(failed)
+            time.sleep(backoff(attempt))
+            pending = failed
+        return results
@@ -0,0 +1,115 @@
+"""Background trash jobs for the Delete button.
+
+Each job trashes one sender's messages by ID with messages().batchModify, up
+to 1000 IDs per call, on a bounded thread pool; the service's QuotaGovernor
+paces the calls and retries 429/5xx answers. Workers never touch
+Streamlit: they publish status on the job objects under a lock, and the app
+reads it (and collects the trashed IDs) on its own thread during reruns.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import scanner
+from governor import governor_for
+from metrics import METRICS
+
+DELETE_WORKERS = 3      # senders trashed concurrently
+MODIFY_CHUNK = 1000     # batchModify maximum
+
+
+class DeleteJob:
+    """Trash job for one sender; fields are only written while holding the pool's lock."""
+
+    def __init__(self, sender, message_ids):
+        self.sender = sender
+        self.message_ids = message_ids  # None: look them up with a from: search first
+        self.status = 'queued'          # queued / running / done / failed
+        self.total = len(message_ids) if message_ids is not None else None
+        self.trashed = 0
+        self.error = None
+
+    def describe(self):
+        if self.status == 'running':
+            return f"Trashing {self.trashed} / {self.total or '?'}..."
+        if self.status == 'done':
+            return f"🗑️ {self.trashed} trashed"
+        if self.status == 'failed':
+            return f"⚠️ Failed after {self.trashed} trashed: {self.error}"
+        return "Queued..."
+
+
+class DeleteJobs:
+    """Bounded pool of DeleteJobs for one session, one job per sender."""
+
+    def __init__(self, service_factory, workers=DELETE_WORKERS):
+        self.service_factory = service_factory
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._trashed_ids = []  # trashed since the last collect_trashed()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delete')
+
+    def submit(self, sender, message_ids=None):
+        """Queues a job unless one is already queued or running for sender."""
+        with self._lock:
+            job = self.jobs.get(sender)
+            if job is not None and job.status in ('queued', 'running'):
+                return job
+            job = self.jobs[sender] = DeleteJob(sender, None if message_ids is None else list(message_ids))
+        self._pool.submit(self._run, job)
+        return job
+
+    def describe(self, sender):
+        with self._lock:
+            job = self.jobs.get(sender)
+            return job.describe() if job else None
+
+    def active(self):
+        with self._lock:
+            return any(job.status in ('queued', 'running') for job in self.jobs.values())
+
+    def snapshot(self):
+        """(sender, status, trashed, total, description) for every job, safe to render."""
+        with self._lock:
+            return [(job.sender, job.status, job.trashed, job.total, job.describe()) for job in self.jobs.values()]
+
+    def collect_trashed(self):
+        """Message IDs trashed since the last call, for the app to uncount."""
+        with self._lock:
+            trashed, self._trashed_ids = self._trashed_ids, []
+        return trashed
+
+    def _service(self):
+        if not hasattr(self._local, 'service'):
+            self._local.service = self.service_factory()
+        return self._local.service
+
+    def _run(self, job):
+        with METRICS.phase('delete_job'):
+            self._trash(job)
+
+    def _trash(self, job):
+        with self._lock:
+            job.status = 'running'
+        try:
+            service = self._service()
+            message_ids = job.message_ids
+            if message_ids is None:
+                message_ids = scanner.list_message_ids(service, query=f"from:{job.sender} in:inbox", limit=None)
+                with self._lock:
+                    job.total = len(message_ids)
+            for i in range(0, len(message_ids), MODIFY_CHUNK):
+                chunk = message_ids[i : i + MODIFY_CHUNK]
+                governor_for(service).execute(service.users().messages().batchModify(
+                    userId='me',
+                    body={'ids': chunk, 'addLabelIds': ['TRASH'], 'removeLabelIds': ['INBOX']}
+                ))
+                with self._lock:
+                    job.trashed += len(chunk)
+                    self._trashed_ids.extend(chunk)
+            with self._lock:
+                job.status = 'done'
+        except Exception as e:
+            with self._lock:
+                job.status = 'failed'
+                job.error = str(e)
@@ -0,0 +1,153 @@
+"""Lightweight, always-on instrumentation for scans, Gmail calls and reruns.
+
+Two kinds of series, both process-wide (shared by every session on the
+server, like the metadata cache):
+
+* phases: how often and for how long each stage ran (listing, fetch,
+  aggregate, verify, render, delete, ...), timed with phase().
+* API calls per Gmail method: calls, latency histogram, quota units,
+  errors and retries, recorded by the QuotaGovernor around every request.
+
+Each observation is a perf_counter() pair and a few additions under one
+lock, which is cheap next to an HTTP round trip. snapshot() returns plain
+dicts for the app's panel; to_json() and to_prometheus() export them.
+"""
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds, Prometheus `le` bounds
+PREFIX = 'gmail_organiser'
+
+
+class _Phase:
+    __slots__ = ('runs', 'seconds', 'max_seconds')
+
+    def __init__(self):
+        self.runs = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+
+class _ApiMethod:
+    __slots__ = ('calls', 'errors', 'retries', 'units', 'seconds', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.units = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+
+
+class Metrics:
+    """Thread-safe registry of phase timings and per-method API stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.phases = {}
+        self.api = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Times the with-block as one run of phase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - start)
+
+    def add_phase(self, name, seconds, runs=1):
+        with self._lock:
+            phase = self.phases.get(name) or self.phases.setdefault(name, _Phase())
+            phase.runs += runs
+            phase.seconds += seconds
+            phase.max_seconds = max(phase.max_seconds, seconds)
+
+    def observe_call(self, method, seconds, calls=1, units=0, errors=0, retries=0):
+        """One HTTP round trip carrying `calls` calls of `method` (more than one for a batch)."""
+        with self._lock:
+            stats = self.api.get(method) or self.api.setdefault(method, _ApiMethod())
+            stats.calls += calls
+            stats.errors += errors
+            stats.retries += retries
+            stats.units += units
+            stats.seconds += seconds
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.phases = {}
+            self.api = {}
+
+    def snapshot(self):
+        """Plain-dict copy of every series, safe to render or serialize."""
+        with self._lock:
+            return {
+                'since': self.started,
+                'phases': {name: {'runs': p.runs, 'seconds': p.seconds, 'max_seconds': p.max_seconds}
+                           for name, p in self.phases.items()},
+                'api': {method: {'calls': a.calls, 'round_trips': sum(a.buckets), 'errors': a.errors,
+                                 'retries': a.retries, 'units': a.units, 'seconds': a.seconds,
+                                 'latency_buckets': dict(zip([*map(str, LATENCY_BUCKETS), '+Inf'], a.buckets))}
+                        for method, a in self.api.items()},
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """The snapshot in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{PREFIX}_{name}{{{label_text}}} {value}")
+
+        phases = sorted(snap['phases'].items())
+        family('phase_runs_total', 'counter', "Times each phase ran.",
+               [({'phase': name}, p['runs']) for name, p in phases])
+        family('phase_seconds_total', 'counter', "Wall time spent in each phase.",
+               [({'phase': name}, p['seconds']) for name, p in phases])
+
+        api = sorted(snap['api'].items())
+        for name, key, help_text in (('api_calls_total', 'calls', "Gmail API calls, batch parts included."),
+                                     ('api_errors_total', 'errors', "Gmail API calls that failed."),
+                                     ('api_retries_total', 'retries', "Gmail API calls sent again."),
+                                     ('api_quota_units_total', 'units', "Quota units charged.")):
+            family(name, 'counter', help_text, [({'method': method}, a[key]) for method, a in api])
+
+        lines.append(f"# HELP {PREFIX}_api_latency_seconds Gmail API round trip latency.")
+        lines.append(f"# TYPE {PREFIX}_api_latency_seconds histogram")
+        for method, a in api:
+            cumulative = 0
+            for le, count in a['latency_buckets'].items():
+                cumulative += count
+                lines.append(f'{PREFIX}_api_latency_seconds_bucket{{method="{method}",le="{le}"}} {cumulative}')
+            lines.append(f'{PREFIX}_api_latency_seconds_sum{{method="{method}"}} {a["seconds"]}')
+            lines.append(f'{PREFIX}_api_latency_seconds_count{{method="{method}"}} {a["round_trips"]}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+def timed(name):
+    """Decorator: every call of the function is one run of phase `name`."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with METRICS.phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,140 @@
+"""Quick estimates from a uniform random sample of the inbox.
+
+A SampleScan lists every inbox message ID (one cheap call per 500 IDs),
+shuffles them and fetches metadata in that random order on a background
+thread. Any prefix of a shuffled list is a uniform sample without
+replacement. Per-sender counts and sizes are therefore extrapolated from the
+messages fetched so far, with confidence intervals that shrink as
+the sample grows. Left running, the sample becomes a census and the
+estimates become exact, so the finished state can replace a full scan.
+
+Like jobs.DeleteJobs, the worker never touches Streamlit: it updates its
+own ScanState under a lock and the app polls estimates() from a fragment.
+"""
+import math
+import random
+import threading
+
+import scanner
+
+SAMPLE_SIZE = 1000  # messages fetched before the first estimate is shown
+Z_95 = 1.96
+
+
+def wilson_interval(hits, n, population, z=Z_95):
+    """Wilson score interval for hits/n, with the finite population correction, scaled to `population`."""
+    if n == 0:
+        return 0.0, float(population)
+    p = hits / n
+    fpc = (population - n) / (population - 1) if population > 1 else 0.0
+    z2 = z * z * fpc
+    denominator = 1 + z2 / n
+    center = (p + z2 / (2 * n)) / denominator
+    half = z * math.sqrt(fpc * (p * (1 - p) / n + z2 / (4 * n * n))) / denominator
+    return max(population * (center - half), hits), population * min(center + half, 1.0)
+
+
+def total_interval(values, n, population, z=Z_95):
+    """Normal interval for the population total of y, given the nonzero y in a sample of n."""
+    if n == 0:
+        return 0.0, 0.0
+    mean = sum(values) / n
+    variance = (sum(v * v for v in values) - n * mean * mean) / (n - 1) if n > 1 else 0.0
+    fpc = (population - n) / (population - 1) if population > 1 else 0.0
+    half = z * population * math.sqrt(max(variance, 0.0) * fpc / n)
+    return max(population * mean - half, sum(values)), population * mean + half
+
+
+class SampleScan:
+    """Background random-order scan whose partial state extrapolates to the whole inbox."""
+
+    def __init__(self, service_factory, sample_size=SAMPLE_SIZE, fraction=None, refine=True,
+                 workers=scanner.WORKERS, cache=None, seed=None):
+        self.service_factory = service_factory
+        self.sample_size = sample_size
+        self.fraction = fraction   # overrides sample_size once the inbox size is known
+        self.refine = refine       # keep sampling after the target, up to the whole inbox
+        self.workers = workers
+        self.cache = cache
+        self.state = scanner.ScanState()
+        self.population = None     # inbox messages listed
+        self.sampled = 0           # messages fetched (failed ones included)
+        self.status = 'listing'    # listing / sampling / sampled / done / stopped / failed
+        self.error = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='sample-scan')
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops refining; the estimates so far stay available."""
+        self._stop.set()
+
+    def active(self):
+        with self._lock:
+            return self.status in ('listing', 'sampling')
+
+    def target(self):
+        """Sample size of the first estimate."""
+        if self.fraction is not None and self.population is not None:
+            return max(1, math.ceil(self.fraction * self.population))
+        return self.sample_size
+
+    def ready(self):
+        with self._lock:
+            return self.population is not None and self.sampled >= min(self.target(), self.population)
+
+    def _run(self):
+        try:
+            service = self.service_factory()
+            history_id = scanner.current_history_id(service)
+            ids = scanner.list_message_ids(service, limit=None)
+            self._random.shuffle(ids)
+            with self._lock:
+                self.population = len(ids)
+                self.status = 'sampling'
+            stop_at = len(ids) if self.refine else min(self.target(), len(ids))
+            pages = (ids[i : min(i + scanner.PAGE_SIZE, stop_at)] for i in range(0, stop_at, scanner.PAGE_SIZE))
+            for records, progress in scanner.stream_metadata(self.service_factory, id_pages=pages,
+                                                             workers=self.workers, cache=self.cache):
+                with self._lock:
+                    scanner.add_batch(self.state, records)
+                    self.sampled = progress.done
+                if self._stop.is_set():
+                    break
+            with self._lock:
+                if self.sampled < len(ids):
+                    self.status = 'stopped' if self._stop.is_set() else 'sampled'
+                    return
+            # Every message was fetched: the sample is a census, as good as a full scan
+            with self._lock:
+                self.state.history_id = history_id
+                self.state.scan_complete = True
+                self.status = 'done'
+        except Exception as e:
+            with self._lock:
+                self.status = 'failed'
+                self.error = str(e)
+
+    def estimates(self, n, exclude=(), by='count'):
+        """The n heaviest senders as (sender, messages, messages low, high, bytes, bytes low, high).
+
+        Intervals are 95%: Wilson for the share of messages, normal for the
+        total bytes, both with the finite population correction, so they
+        close up completely once the whole inbox has been sampled.
+        """
+        with self._lock:
+            state, population = self.state, self.population or 0
+            fetched = len(state.messages)
+            scale = population / fetched if fetched else 0.0
+            rows = []
+            for sender, _ in scanner.top_senders(state, n, exclude=exclude, by=by):
+                sizes = [state.messages[msg_id][1] for msg_id in state.sender_messages.get(sender, ())]
+                low, high = wilson_interval(len(sizes), fetched, population)
+                bytes_low, bytes_high = total_interval(sizes, fetched, population)
+                rows.append((sender, len(sizes) * scale, low, high, sum(sizes) * scale, bytes_low, bytes_high))
+            return rows
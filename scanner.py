@@ -0,0 +1,669 @@
+"""Scan engine: pages the inbox, fetches sender metadata and aggregates it.
+
+Nothing in here touches Streamlit, so the same code runs in the app, in the
+offline benchmark and against the fake Gmail service in fake_gmail.py.
+
+A scan streams: ID pages -> ID chunks -> metadata batches -> aggregation,
+through bounded queues, so the pipeline's working set doesn't grow with the
+mailbox and the caller sees partial rankings after every batch. What does
+grow is the per-message index (message id -> sender, size) the sender
+tables are built from, which exact deletes and history sync depend on.
+Each stage is timed as a metrics.METRICS phase.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from googleapiclient.errors import HttpError
+
+from governor import backoff, governor_for
+from metrics import METRICS
+from senders import normalize_sender
+from sketch import CountMinSketch
+from store import ACTIONED, IGNORED, SenderTable
+
+SCAN_QUERY = 'label:inbox -label:trash'
+TARGET_LIMIT = None  # messages per full scan; None scans the whole inbox
+PAGE_SIZE = 500    # messages().list maximum; Gmail caps larger maxResults at 500
+BATCH_SIZE = 50    # messages().get calls per HTTP batch
+WORKERS = 4        # concurrent HTTP batches, each on its own connection
+QUEUE_DEPTH = 4    # ID chunks buffered per worker ahead of the fetchers
+SKETCH_EPSILON = 0.001  # sketch overestimate bound, as a fraction of scanned messages
+SKETCH_DELTA = 0.01     # probability that a count exceeds that bound
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+VERIFY_TTL = 600        # seconds a live from: count stays valid for an unchanged sender
+SHARDS = 4              # date-range shards of a sharded full scan; only pays off with quota headroom
+SHARD_WORKERS = 2       # fetch threads per shard
+SHARD_RETRIES = 2       # times a failed shard is rescanned on its own
+MIN_SHARD_MESSAGES = 2000  # smaller inboxes use fewer shards
+MAX_AGE_DAYS = 30 * 365    # oldest shard boundary the planner considers
+SIZE_THRESHOLDS = [50 * 1024 * 2 ** k for k in range(10)]  # storage pre-scan buckets, 50 KB .. 25 MB
+PRESCAN_BYTES_SHARE = 0.6      # fetch the largest buckets until they hold this share of the estimated bytes
+PRESCAN_MAX_MESSAGES = 5000    # ... or this many messages
+DAY = 24 * 3600
+
+
+class ScanState:
+    """Same fields the app keeps in st.session_state, for Streamlit-free callers."""
+
+    def __init__(self):
+        reset_scan(self)
+
+
+class VerifiedCounts:
+    """Live `from:` counts, for when the scan index doesn't cover the whole inbox.
+
+    Each count is kept for VERIFY_TTL seconds and dropped early as soon as the
+    sender's messages change, so table reruns cost no API calls.
+    """
+
+    def __init__(self, ttl=VERIFY_TTL):
+        self.ttl = ttl
+        self.counts = {}  # sender -> (count, fetched at)
+
+    def get(self, service, sender):
+        cached = self.counts.get(sender)
+        if cached and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+        with METRICS.phase('verify'):
+            count = len(list_message_ids(service, query=f"from:{sender} in:inbox", limit=None))
+        self.counts[sender] = (count, time.monotonic())
+        return count
+
+    def invalidate(self, senders):
+        for sender in senders:
+            self.counts.pop(sender, None)
+
+
+class ScanProgress:
+    """Completed work of a running scan: messages processed, failed and IDs listed so far."""
+
+    def __init__(self):
+        self.done = 0
+        self.listed = 0
+        self.failed = 0
+        self.listing_done = False
+
+
+def reset_scan(state, keep_flags=IGNORED | ACTIONED):
+    """Clears everything a scan produced, ready for a full rescan.
+
+    The user's own marks on senders (by default ignored and actioned) carry
+    over to the new sender table; pass keep_flags=0 to drop them too.
+    """
+    senders = SenderTable()
+    if keep_flags and hasattr(state, 'senders'):
+        senders.copy_flags(state.senders, keep_flags)
+    state.senders = senders     # interned senders with counts, bytes and flags, see store.py
+    state.total_size = 0
+    state.messages = {}         # message id -> (sender, size) of every counted message
+    state.sender_messages = {}  # sender -> set of message ids, the exact per-sender index
+    state.scan_complete = False  # False if the scan stopped at its message limit
+    state.verified = VerifiedCounts()
+    state.history_id = None
+    state.size_histogram = None  # [(lower, upper, messages, estimated bytes)] from storage_prescan
+
+
+def new_sketch():
+    """Empty sender sketch sized from SKETCH_EPSILON / SKETCH_DELTA."""
+    return CountMinSketch.from_error(SKETCH_EPSILON, SKETCH_DELTA)
+
+
+def sender_sketch(state):
+    """Count-Min summary of the scanned per-sender counts, built on demand.
+
+    Ranking reads the exact sender table, so no sketch is kept up to date
+    batch by batch. This one goes into snapshots as a fixed-size grid that
+    outside readers can compare or add up across accounts and scans without
+    the sender strings; building it costs one hash per sender, once.
+    """
+    sketch = new_sketch()
+    n = len(state.senders)
+    present = np.flatnonzero(state.senders.counts[:n] > 0)
+    sketch.add_many([state.senders.names[i] for i in present], state.senders.counts[present])
+    return sketch
+
+
+def sender_of(response):
+    """Canonical sender (see senders.normalize_sender) of a metadata response."""
+    headers = response.get('payload', {}).get('headers', [])
+    return normalize_sender(next((h['value'] for h in headers if h['name'] == 'From'), "Unknown"))
+
+
+def message_record(response):
+    """(id, sender, size, internal_date) of one messages().get metadata response."""
+    return (response['id'], sender_of(response),
+            response.get('sizeEstimate', 0), int(response.get('internalDate', 0)))
+
+
+def add_batch(state, records):
+    """Folds a batch of message records into the sender tables."""
+    with METRICS.phase('aggregate'):
+        _add_batch(state, records)
+
+
+def _add_batch(state, records):
+    batch_counts, batch_sizes = {}, {}
+    for msg_id, sender, size, _ in records:
+        if msg_id in state.messages:
+            continue
+        state.messages[msg_id] = (sender, size)
+        state.sender_messages.setdefault(sender, set()).add(msg_id)
+        batch_counts[sender] = batch_counts.get(sender, 0) + 1
+        batch_sizes[sender] = batch_sizes.get(sender, 0) + size
+    if not batch_counts:
+        return
+    # The scan has seen every message, so rank by exact counts
+    state.senders.add(batch_counts.keys(), list(batch_counts.values()), list(batch_sizes.values()))
+    state.total_size += sum(batch_sizes.values())
+    state.verified.invalidate(batch_counts)
+
+
+def remove_messages(state, message_ids, rerank=True):
+    """Takes previously counted messages back out of the sender tables."""
+    batch_counts, batch_sizes = {}, {}
+    for msg_id in message_ids:
+        counted = state.messages.pop(msg_id, None)
+        if counted is None:
+            continue
+        sender, size = counted
+        state.sender_messages[sender].discard(msg_id)
+        batch_counts[sender] = batch_counts.get(sender, 0) - 1
+        batch_sizes[sender] = batch_sizes.get(sender, 0) - size
+    if not batch_counts:
+        return
+    state.senders.add(batch_counts.keys(), list(batch_counts.values()), list(batch_sizes.values()), rerank)
+    state.total_size += sum(batch_sizes.values())
+    state.verified.invalidate(batch_counts)
+
+
+def sender_count(state, sender):
+    """Exact number of scanned inbox messages from sender."""
+    return state.senders.count(sender)
+
+
+def top_senders(state, n, exclude=(), service=None, by='count'):
+    """The n heaviest (sender, count) pairs, or (sender, bytes) pairs with by='size'.
+
+    Counts and sizes are exact, from the scan index; ignored and hidden
+    senders are skipped. Only when the scan stopped at its message limit are
+    counts verified live through `service`, and those are cached per sender
+    in state.verified.
+    """
+    candidates = state.senders.top(n, by, exclude)
+    if by == 'size':
+        return candidates
+    if state.scan_complete or service is None:
+        return candidates
+    verified = []
+    for sender, count in candidates:
+        try:
+            verified.append((sender, state.verified.get(service, sender)))
+        except HttpError:
+            verified.append((sender, count))
+    return sorted(verified, key=lambda x: x[1], reverse=True)
+
+
+def size_distribution(state, senders):
+    """Per-sender message size summary (messages, total, median, p90, largest bytes), one row per sender.
+
+    Built with a single pandas groupby over those senders' scanned messages.
+    """
+    frame = pd.DataFrame(
+        [(sender, state.messages[msg_id][1]) for sender in senders for msg_id in state.sender_messages.get(sender, ())],
+        columns=['sender', 'size'],
+    ).astype({'size': np.int64})
+    grouped = frame.groupby('sender', sort=False)['size']
+    summary = grouped.agg(messages='count', total='sum', median='median', largest='max')
+    summary.insert(3, 'p90', grouped.quantile(0.9))
+    return summary.reindex(senders)
+
+
+def iter_id_pages(service, query=SCAN_QUERY, limit=TARGET_LIMIT):
+    """Yields message IDs one messages().list page at a time, up to `limit` (None: all) in total."""
+    listed = 0
+    next_page_token = None
+    while limit is None or listed < limit:
+        with METRICS.phase('list'):
+            results = governor_for(service).execute(service.users().messages().list(
+                userId='me', q=query,
+                maxResults=PAGE_SIZE, pageToken=next_page_token
+            ))
+        ids = [m['id'] for m in results.get('messages', [])]
+        if limit is not None:
+            ids = ids[:limit - listed]
+        listed += len(ids)
+        if ids:
+            yield ids
+        next_page_token = results.get('nextPageToken')
+        if not next_page_token: break
+
+
+def list_message_ids(service, query=SCAN_QUERY, limit=TARGET_LIMIT):
+    """Pages through messages().list and returns up to `limit` message IDs."""
+    return [msg_id for page in iter_id_pages(service, query, limit) for msg_id in page]
+
+
+def fetch_batch(service, message_ids):
+    """Runs one HTTP batch of metadata gets; returns (response, exception) per message.
+
+    Throttled parts are retried by the governor, so an exception here means
+    the message really couldn't be fetched.
+    """
+    requests = [service.users().messages().get(
+        userId='me', id=msg_id, format='metadata', metadataHeaders=['From']
+    ) for msg_id in message_ids]
+    return governor_for(service).execute_batch(service, requests)
+
+
+def fetch_records(service, message_ids, cache=None):
+    """Fetches one HTTP batch and returns the records of the messages that came back."""
+    with METRICS.phase('fetch'):
+        records = [message_record(response) for response, exception in fetch_batch(service, message_ids)
+                   if exception is None]
+    if cache is not None:
+        cache.put_many(records)
+    return records
+
+
+def stream_metadata(service_factory, query=SCAN_QUERY, limit=TARGET_LIMIT,
+                    workers=WORKERS, batch_size=BATCH_SIZE, cache=None, id_pages=None):
+    """Pipelined metadata fetch, yielding (records, ScanProgress) per finished batch.
+
+    A lister thread pages messages().list and feeds batch_size ID chunks into a
+    bounded queue while `workers` threads run the HTTP batches concurrently.
+    Every thread builds its own service through `service_factory`, so each one
+    has its own HTTP connection. The service's QuotaGovernor decides how big
+    each HTTP batch is and how many run at once. Batches are yielded in
+    completion order on the caller's thread, which is where aggregation
+    should happen.
+
+    With a `cache` (see cache.AccountCache) the lister answers already-known
+    IDs straight from disk and only the rest are fetched, then cached.
+    Pass `id_pages` (an iterable of ID lists) to fetch known IDs, in that
+    order, instead of listing `query`.
+    """
+    chunks = queue.Queue(maxsize=workers * QUEUE_DEPTH)
+    events = queue.Queue(maxsize=workers * QUEUE_DEPTH)
+    stop = threading.Event()
+
+    def put(q, item):
+        # Blocks for backpressure, but gives up once the scan is being torn down
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def lister():
+        try:
+            service = service_factory()
+            pages = iter_id_pages(service, query, limit) if id_pages is None else id_pages
+            for page in pages:
+                if not put(events, ('listed', len(page))):
+                    return
+                if cache is not None:
+                    cached = cache.get_many(page)
+                    if cached and not put(events, ('batch', (list(cached.values()), len(cached)))):
+                        return
+                    page = [msg_id for msg_id in page if msg_id not in cached]
+                for i in range(0, len(page), batch_size):
+                    if not put(chunks, page[i : i + batch_size]):
+                        return
+            put(events, ('listing_done', None))
+        except Exception as e:
+            put(events, ('error', e))
+            stop.set()
+
+    def worker():
+        try:
+            service = service_factory()
+            governor = governor_for(service)
+            while not stop.is_set():
+                try:
+                    chunk = chunks.get(timeout=0.1)
+                except queue.Empty:
+                    if not threads[0].is_alive() and chunks.empty():
+                        return
+                    continue
+                step = governor.batch_size
+                for i in range(0, len(chunk), step):
+                    part = chunk[i : i + step]
+                    with governor.slot():
+                        records = fetch_records(service, part, cache)
+                    if not put(events, ('batch', (records, len(part)))):
+                        return
+        except Exception as e:
+            put(events, ('error', e))
+            stop.set()
+
+    threads = [threading.Thread(target=lister, daemon=True)]
+    threads += [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    progress = ScanProgress()
+    error = None
+    try:
+        while True:
+            try:
+                kind, payload = events.get(timeout=0.1)
+            except queue.Empty:
+                if any(thread.is_alive() for thread in threads):
+                    continue
+                if events.empty():
+                    break
+                kind, payload = events.get()
+            if kind == 'listed':
+                progress.listed += payload
+            elif kind == 'listing_done':
+                progress.listing_done = True
+            elif kind == 'error':
+                error = error or payload
+            elif kind == 'batch' and error is None:
+                records, attempted = payload
+                progress.done += attempted
+                progress.failed += attempted - len(records)
+                yield records, progress
+    finally:
+        stop.set()
+    if error is not None:
+        raise error
+
+
+def run_scan(service_factory, state, limit=TARGET_LIMIT, workers=WORKERS, on_progress=None, cache=None):
+    """Full scan of the inbox into `state`. Returns the number of messages listed.
+
+    `state` is updated batch by batch, so on_progress(progress) can already
+    render the partial ranking from it.
+    """
+    history_id = current_history_id(service_factory())
+    progress = ScanProgress()
+    with METRICS.phase('scan'):
+        for records, progress in stream_metadata(service_factory, limit=limit, workers=workers, cache=cache):
+            add_batch(state, records)
+            if on_progress:
+                with METRICS.phase('progress_callback'):
+                    on_progress(progress)
+    state.history_id = history_id
+    state.scan_complete = limit is None or progress.listed < limit
+    return progress.listed
+
+
+def current_history_id(service):
+    """The mailbox's current historyId, where the next incremental sync starts.
+
+    Scans read it before listing starts: mail that arrives while a scan runs
+    is then replayed by the next sync, which skips messages already counted.
+    """
+    profile = governor_for(service).execute(service.users().getProfile(userId='me'))
+    return profile['historyId']
+
+
+def estimate_count(service, query):
+    """Gmail's resultSizeEstimate for query: one cheap list call, no paging."""
+    result = governor_for(service).execute(service.users().messages().list(userId='me', q=query, maxResults=1))
+    return result.get('resultSizeEstimate', 0)
+
+
+def plan_shards(service, n_shards=SHARDS, query=SCAN_QUERY):
+    """Splits query into up to n_shards `after:`/`before:` date ranges of similar size.
+
+    Each boundary is found by bisecting over whole days back from the newest
+    message with estimate_count, about a dozen list calls per boundary.
+    Neighbouring shards share their boundary second; add_batch counts the
+    messages there once.
+    """
+    total = estimate_count(service, query)
+    n_shards = min(n_shards, total // MIN_SHARD_MESSAGES)
+    newest_ids = list_message_ids(service, query, limit=1)
+    if n_shards <= 1 or not newest_ids:
+        return [query]
+    newest = fetch_records(service, newest_ids)[0][3] // 1000
+
+    estimates = {}
+
+    def newer_than(days):
+        if days not in estimates:
+            estimates[days] = estimate_count(service, f"{query} after:{newest - days * DAY}")
+        return estimates[days]
+
+    cuts = []  # epoch seconds, newest first
+    low = 0
+    for k in range(1, n_shards):
+        high = MAX_AGE_DAYS
+        while low < high:
+            mid = (low + high) // 2
+            if newer_than(mid) >= total * k / n_shards:
+                high = mid
+            else:
+                low = mid + 1
+        if low >= MAX_AGE_DAYS:
+            break
+        cut = newest - low * DAY
+        if not cuts or cut < cuts[-1]:
+            cuts.append(cut)
+
+    bounds = [None] + cuts + [None]
+    shards = []
+    for newer_cut, older_cut in zip(bounds, bounds[1:]):
+        terms = [query]
+        if older_cut is not None:
+            terms.append(f"after:{older_cut}")
+        if newer_cut is not None:
+            terms.append(f"before:{newer_cut + 1}")
+        shards.append(' '.join(terms))
+    return shards
+
+
+def run_sharded_scan(service_factory, state, shards=SHARDS, workers=SHARD_WORKERS, on_progress=None, cache=None):
+    """Full scan of the inbox into `state` as parallel date-range shards. Returns the messages listed.
+
+    Each shard streams on its own thread and hands its batches to the
+    caller's thread, which adds them to `state` as they arrive, so the
+    partial ranking and the summed progress stay live for the whole scan.
+    A shard that fails is rescanned from scratch on its own, up to
+    SHARD_RETRIES times; add_batch skips the messages it already counted.
+    """
+    history_id = current_history_id(service_factory())
+    with METRICS.phase('plan_shards'):
+        queries = plan_shards(service_factory(), shards)
+    shard_progress = {query: ScanProgress() for query in queries}
+    batches = queue.Queue()  # (query, records, progress) from every shard, drained by this thread
+    stop = threading.Event()
+
+    def scan_shard(query):
+        for attempt in range(SHARD_RETRIES + 1):
+            try:
+                for records, progress in stream_metadata(service_factory, query, limit=None,
+                                                         workers=workers, cache=cache):
+                    batches.put((query, records, progress))
+                    if stop.is_set():
+                        return
+                return
+            except HttpError:
+                if attempt == SHARD_RETRIES:
+                    raise
+                time.sleep(backoff(attempt))
+
+    with METRICS.phase('scan'), ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix='shard') as pool:
+        futures = [pool.submit(scan_shard, query) for query in queries]
+        try:
+            while True:
+                try:
+                    query, records, progress = batches.get(timeout=0.25)
+                except queue.Empty:
+                    failed = next((f for f in futures if f.done() and f.exception()), None)
+                    if failed is not None:
+                        raise failed.exception()
+                    # A finished shard has queued all its batches, so empty now means done
+                    if all(f.done() for f in futures) and batches.empty():
+                        break
+                    continue
+                add_batch(state, records)
+                shard_progress[query] = progress
+                if on_progress:
+                    total = ScanProgress()
+                    for part in shard_progress.values():
+                        total.done += part.done
+                        total.listed += part.listed
+                        total.failed += part.failed
+                    total.listing_done = all(part.listing_done for part in shard_progress.values())
+                    with METRICS.phase('progress_callback'):
+                        on_progress(total)
+        finally:
+            stop.set()
+    state.history_id = history_id
+    state.scan_complete = True
+    return sum(part.listed for part in shard_progress.values())
+
+
+def sync_history(service, state, cache=None):
+    """Applies the inbox changes since state.history_id via history().list.
+
+    Returns the number of messages added or removed, or None when Gmail no
+    longer has history that far back (404) and a full scan is needed.
+    """
+    with METRICS.phase('history_sync'):
+        return _sync_history(service, state, cache)
+
+
+def _sync_history(service, state, cache):
+    in_inbox = {}  # message id -> in the inbox after all changes
+    history_id = state.history_id
+    next_page_token = None
+    try:
+        while True:
+            results = governor_for(service).execute(service.users().history().list(
+                userId='me', startHistoryId=state.history_id, historyTypes=HISTORY_TYPES,
+                maxResults=500, pageToken=next_page_token
+            ))
+            for record in results.get('history', []):
+                for item in record.get('messagesDeleted', []):
+                    in_inbox[item['message']['id']] = False
+                for change in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+                    for item in record.get(change, []):
+                        labels = item['message'].get('labelIds', [])
+                        in_inbox[item['message']['id']] = 'INBOX' in labels and 'TRASH' not in labels
+            history_id = results.get('historyId', history_id)
+            next_page_token = results.get('nextPageToken')
+            if not next_page_token: break
+    except HttpError as e:
+        if e.resp.status == 404:
+            return None
+        raise
+
+    removed = [msg_id for msg_id, keep in in_inbox.items() if not keep and msg_id in state.messages]
+    added = [msg_id for msg_id, keep in in_inbox.items() if keep and msg_id not in state.messages]
+    remove_messages(state, removed)
+    if cache is not None:
+        # Messages restored from the trash were probably fetched before
+        cached = cache.get_many(added)
+        add_batch(state, cached.values())
+        added_uncached = [msg_id for msg_id in added if msg_id not in cached]
+    else:
+        added_uncached = added
+    for i in range(0, len(added_uncached), BATCH_SIZE):
+        add_batch(state, fetch_records(service, added_uncached[i : i + BATCH_SIZE], cache))
+    state.history_id = history_id
+    return len(added) + len(removed)
+
+
+def size_buckets(thresholds=SIZE_THRESHOLDS):
+    """(lower, upper) byte bounds of the pre-scan buckets, smallest first; None is unbounded."""
+    bounds = [None] + list(thresholds) + [None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def bucket_query(lower, upper, query=SCAN_QUERY):
+    terms = [query]
+    if lower is not None:
+        terms.append(f"larger:{lower}")
+    if upper is not None:
+        terms.append(f"smaller:{upper}")
+    return ' '.join(terms)
+
+
+def size_histogram(service, query=SCAN_QUERY, thresholds=SIZE_THRESHOLDS):
+    """Approximate inbox size histogram from one resultSizeEstimate per size bucket.
+
+    Returns [(lower, upper, messages, estimated bytes)], smallest bucket
+    first. A bucket's bytes are its count times a typical size: the
+    geometric mean of its bounds, half the smallest threshold for the first
+    bucket and twice the largest threshold for the last one.
+    """
+    histogram = []
+    for lower, upper in size_buckets(thresholds):
+        messages = estimate_count(service, bucket_query(lower, upper, query))
+        if lower is None:
+            typical = upper / 2
+        elif upper is None:
+            typical = lower * 2
+        else:
+            typical = (lower * upper) ** 0.5
+        histogram.append((lower, upper, messages, int(messages * typical)))
+    return histogram
+
+
+def storage_prescan(service_factory, state, workers=WORKERS, on_progress=None, cache=None,
+                    thresholds=SIZE_THRESHOLDS):
+    """Quick scan of only the largest messages, for finding storage hogs in seconds.
+
+    Builds size_histogram(), then fetches metadata just for the largest
+    buckets that together hold PRESCAN_BYTES_SHARE of the estimated bytes
+    (capped near PRESCAN_MAX_MESSAGES). The state is reset first and is left
+    incomplete (no historyId), so the next scan_inbox is a full scan.
+    The histogram is kept in state.size_histogram. Returns the number of
+    messages fetched.
+    """
+    service = service_factory()
+    with METRICS.phase('size_histogram'):
+        histogram = size_histogram(service, thresholds=thresholds)
+    total_bytes = sum(row[3] for row in histogram)
+    cutoff, taken_bytes, taken_messages = None, 0, 0
+    for lower, _, messages, estimated_bytes in reversed(histogram):
+        if lower is None or (taken_messages and taken_messages + messages > PRESCAN_MAX_MESSAGES):
+            break
+        cutoff = lower
+        taken_bytes += estimated_bytes
+        taken_messages += messages
+        if taken_bytes >= total_bytes * PRESCAN_BYTES_SHARE:
+            break
+
+    reset_scan(state)
+    state.size_histogram = histogram
+    if cutoff is None:
+        return 0
+    progress = ScanProgress()
+    with METRICS.phase('scan'):
+        for records, progress in stream_metadata(service_factory, bucket_query(cutoff, None), limit=None,
+                                                 workers=workers, cache=cache):
+            add_batch(state, records)
+            if on_progress:
+                on_progress(progress)
+    return progress.done
+
+
+def scan_inbox(service_factory, state, limit=TARGET_LIMIT, workers=WORKERS, on_progress=None, cache=None,
+               shards=1):
+    """Incremental sync of a complete earlier scan, otherwise a full scan.
+
+    Only a scan that covered the whole inbox is synced: one that stopped at
+    its message limit is redone in full, so raising or clearing the limit
+    picks up the rest of the inbox. A full scan of the whole inbox (no
+    limit) runs as `shards` parallel date ranges when shards > 1. Returns
+    ('incremental', messages changed) or ('full', messages listed).
+    """
+    if state.history_id is not None and state.scan_complete:
+        changed = sync_history(service_factory(), state, cache)
+        if changed is not None:
+            return 'incremental', changed
+    reset_scan(state)
+    if shards > 1 and limit is None:
+        return 'full', run_sharded_scan(service_factory, state, shards, on_progress=on_progress, cache=cache)
+    return 'full', run_scan(service_factory, state, limit, workers, on_progress, cache)
@@ -0,0 +1,39 @@
+"""Canonical sender keys.
+
+"Acme <news@acme.com>", "ACME News <news@acme.com>" and "news@acme.com" are
+one sender. Everything keyed by sender (counts, sizes, the snapshot sketch,
+delete searches and filter criteria) uses the lowercase address from here
+instead of the raw From header. The same few thousand headers repeat across a whole
+mailbox, so parsing is memoized in a bounded LRU cache.
+"""
+import functools
+from email.utils import parseaddr
+
+SENDER_CACHE_SIZE = 16384
+FOLD_PLUS_ADDRESSING = False  # news+promo@acme.com -> news@acme.com
+FOLD_SUBDOMAINS = False       # news@mail.acme.com -> news@acme.com
+
+# Second-level labels that belong to the public suffix (acme.co.uk, not co.uk)
+_SECOND_LEVEL = {'co', 'com', 'net', 'org', 'gov', 'ac', 'edu'}
+
+
+def registrable_domain(domain):
+    """acme.com for mail.news.acme.com; keeps three labels for acme.co.uk-style domains."""
+    labels = domain.split('.')
+    keep = 3 if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL else 2
+    return '.'.join(labels[-keep:])
+
+
+@functools.lru_cache(maxsize=SENDER_CACHE_SIZE)
+def normalize_sender(header, fold_plus=FOLD_PLUS_ADDRESSING, fold_subdomains=FOLD_SUBDOMAINS):
+    """Canonical key for a From header value: its lowercase email address."""
+    _, address = parseaddr(header)
+    address = (address or header).strip().lower()
+    if '@' not in address:
+        return header.strip().lower() or 'unknown'
+    local, domain = address.rsplit('@', 1)
+    if fold_plus:
+        local = local.split('+', 1)[0]
+    if fold_subdomains:
+        domain = registrable_domain(domain)
+    return f"{local}@{domain}"
@@ -0,0 +1,53 @@
+"""Fixed-size summary of per-sender message counts."""
+import math
+
+import mmh3
+import numpy as np
+
+
+class CountMinSketch:
+    """Count-Min Sketch with integer counters and whole-batch updates.
+
+    Each distinct key is hashed once with 128-bit MurmurHash3 and the two
+    64-bit halves give every row its column (Kirsch-Mitzenmacher double
+    hashing), so a batch costs one hash per key plus a NumPy scatter-add.
+    With conservative update a key only raises the cells that are at its
+    current minimum, which removes most of the overestimate from collisions.
+    """
+
+    def __init__(self, width=2000, depth=4, conservative=True, dtype=np.uint32):
+        self.width = int(width)
+        self.depth = int(depth)
+        self.conservative = conservative
+        self.table = np.zeros((self.depth, self.width), dtype=dtype)
+        self.total = 0
+
+    @classmethod
+    def from_error(cls, epsilon, delta, **kwargs):
+        """Sized so estimates exceed the true count by at most epsilon * total with probability 1 - delta."""
+        width = math.ceil(math.e / epsilon)
+        depth = math.ceil(math.log(1 / delta))
+        return cls(width, depth, **kwargs)
+
+    def _columns(self, keys):
+        hashes = np.array([mmh3.hash64(key, signed=False) for key in keys], dtype=np.uint64).reshape(-1, 2)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((hashes[:, 0] + rows * hashes[:, 1]) % np.uint64(self.width)).astype(np.intp)
+
+    def add_many(self, keys, counts=None):
+        """Adds `counts` (default 1 each) for a batch of distinct keys; returns their new estimates."""
+        keys = list(keys)
+        if not keys:
+            return np.zeros(0, dtype=np.int64)
+        counts = np.ones(len(keys), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        cols = self._columns(keys)
+        rows = np.broadcast_to(np.arange(self.depth)[:, None], cols.shape)
+        if self.conservative:
+            # Keys sharing a cell in the same batch take the max of their targets,
+            # so no key is ever underestimated.
+            target = self.table[rows, cols].min(axis=0).astype(np.int64) + counts
+            np.maximum.at(self.table, (rows, cols), np.broadcast_to(target, cols.shape).astype(self.table.dtype))
+        else:
+            np.add.at(self.table, (rows, cols), np.broadcast_to(counts, cols.shape).astype(self.table.dtype))
+        self.total += int(counts.sum())
+        return self.table[rows, cols].min(axis=0).astype(np.int64)
@@ -0,0 +1,181 @@
+"""Binary snapshots of a finished scan, so a new session starts with results.
+
+A Streamlit session lives only as long as the browser tab: a refresh, a
+redeploy or the OAuth redirect clears st.session_state and with it a scan
+that may have taken minutes. save() writes everything the app keeps about a
+scan into one .npz file: the sender table with its ignored and actioned
+flags, a sketch grid of the sender counts (see scanner.sender_sketch), the
+per-message index, the historyId and last_scanned. load() puts the scan back
+with a few array reads and no Gmail calls; the grid is only for readers
+outside the app, since the exact table answers every count.
+Strings (senders, message IDs) are stored as one UTF-8 blob each rather than
+as NumPy string arrays, which keeps the file small and loadable without
+pickle. Like the metadata cache, files are named by the hashed account, never
+the address.
+
+Clicks that only mark senders (Ignore, Delete, Refresh, Include Back) call
+save_flags() instead, which writes just the flagged senders to a small
+side file; load() applies it on top, and the next full save() folds it in.
+"""
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+import scanner
+from cache import CACHE_PATH
+from metrics import METRICS
+from store import SenderTable
+
+SNAPSHOT_DIR = os.environ.get(
+    'GMAIL_ORGANISER_SNAPSHOTS',
+    os.path.join(os.path.dirname(CACHE_PATH), 'snapshots'),
+)
+FORMAT_VERSION = 1  # bump when the arrays below change; older files are then ignored
+UNBOUNDED = -1      # a None size bound in size_histogram
+
+
+def path_for(account_hash, directory=SNAPSHOT_DIR):
+    return os.path.join(directory, f"{account_hash}.npz")
+
+
+def _flags_path(path):
+    return path[:-len('.npz')] + '.flags.npz'
+
+
+def _write(path, compress=True, **arrays):
+    """np.savez(_compressed) to path through a temp file, so readers never see half a file."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            (np.savez_compressed if compress else np.savez)(f, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _pack(strings):
+    """Newline-joined UTF-8 bytes; senders and message IDs never contain a newline."""
+    return np.frombuffer('\n'.join(strings).encode(), dtype=np.uint8)
+
+
+def _unpack(blob, n):
+    return blob.tobytes().decode().split('\n') if n else []
+
+
+def save(state, path):
+    """Writes the scan in state to path atomically; returns the file size in bytes."""
+    senders = state.senders
+    n = len(senders)
+    message_ids = list(state.messages)
+    sketch = scanner.sender_sketch(state)
+    histogram = np.array([[UNBOUNDED if v is None else v for v in row] for row in state.size_histogram or ()],
+                         dtype=np.int64).reshape(-1, 4)
+    with METRICS.phase('snapshot_save'):
+        _write(
+            path,
+            version=np.int64(FORMAT_VERSION),
+            senders=_pack(senders.names),
+            counts=senders.counts[:n],
+            sizes=senders.sizes[:n],
+            ranked=senders.ranked[:n],
+            flags=senders.flags[:n],
+            sketch=sketch.table,
+            sketch_total=np.int64(sketch.total),
+            message_ids=_pack(message_ids),
+            message_senders=np.fromiter((senders.index[state.messages[msg_id][0]] for msg_id in message_ids),
+                                        dtype=np.int32, count=len(message_ids)),
+            message_sizes=np.fromiter((state.messages[msg_id][1] for msg_id in message_ids),
+                                      dtype=np.int64, count=len(message_ids)),
+            total_size=np.int64(state.total_size),
+            scan_complete=np.bool_(state.scan_complete),
+            history_id=np.str_(state.history_id or ''),
+            last_scanned=np.str_(getattr(state, 'last_scanned', None) or ''),
+            size_histogram=histogram,
+        )
+        # The flags just written are current, so an older side file would only undo them
+        _remove(_flags_path(path))
+    return os.path.getsize(path)
+
+
+def save_flags(state, path):
+    """Writes only the senders' flags next to the snapshot at path, in about a millisecond."""
+    senders = state.senders
+    flagged = np.flatnonzero(senders.flags[:len(senders)])
+    with METRICS.phase('snapshot_save_flags'):
+        _write(_flags_path(path), compress=False, version=np.int64(FORMAT_VERSION),
+               senders=_pack(senders.names[i] for i in flagged), flags=senders.flags[flagged])
+
+
+def load(state, path):
+    """Replaces the scan in state with the snapshot at path.
+
+    Returns False, leaving state untouched, when there is no snapshot or it
+    is unreadable or from another format version.
+    """
+    try:
+        with METRICS.phase('snapshot_load'), np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != FORMAT_VERSION:
+                return False
+            arrays = {name: data[name] for name in data.files}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return False
+    flag_arrays = _read_flags(_flags_path(path))
+
+    with METRICS.phase('snapshot_restore'):
+        senders = SenderTable.from_arrays(_unpack(arrays['senders'], len(arrays['counts'])), arrays['counts'],
+                                          arrays['sizes'], arrays['ranked'], arrays['flags'])
+        if flag_arrays is not None:
+            # Marks made since the last full save replace the ones in it
+            senders.flags[:] = 0
+            for sender, flag in zip(_unpack(flag_arrays['senders'], len(flag_arrays['flags'])),
+                                    flag_arrays['flags'].tolist()):
+                senders.set_flag(sender, flag)
+
+        message_ids = _unpack(arrays['message_ids'], len(arrays['message_sizes']))
+        message_senders = [senders.names[i] for i in arrays['message_senders'].tolist()]
+        messages = dict(zip(message_ids, zip(message_senders, arrays['message_sizes'].tolist())))
+        sender_messages = {}
+        for msg_id, sender in zip(message_ids, message_senders):
+            sender_messages.setdefault(sender, set()).add(msg_id)
+
+        scanner.reset_scan(state, keep_flags=0)
+        state.senders = senders
+        state.messages = messages
+        state.sender_messages = sender_messages
+        state.total_size = int(arrays['total_size'])
+        state.scan_complete = bool(arrays['scan_complete'])
+        state.history_id = str(arrays['history_id']) or None
+        state.last_scanned = str(arrays['last_scanned']) or None
+        state.size_histogram = [tuple(None if v == UNBOUNDED else v for v in row)
+                                for row in arrays['size_histogram'].tolist()] or None
+    return True
+
+
+def _read_flags(path):
+    """The side file's arrays, or None if there is none (or it can't be used)."""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != FORMAT_VERSION:
+                return None
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def delete(path):
+    """Removes a snapshot and its flags; returns whether there was one."""
+    _remove(_flags_path(path))
+    return _remove(path)
@@ -0,0 +1,118 @@
+"""Compact per-sender table for a scan.
+
+Each sender string is interned once as a small integer ID. Its message
+count, bytes, ranking count and status flags then live in parallel NumPy
+arrays at that index, instead of in several dicts and sets keyed by the
+full string. Filtering and top-k selection are one vectorized mask plus an
+argpartition, so a table rerun stays in the microseconds as senders grow.
+"""
+import numpy as np
+
+IGNORED = 1   # whitelisted: left out of rankings and never actioned
+ACTIONED = 2  # delete submitted; shown as processed until the table is refreshed
+HIDDEN = 4    # refreshed away after being actioned, until the next full scan
+INITIAL_CAPACITY = 1024
+
+
+class SenderTable:
+    """Interned senders with exact message counts, bytes and flags per sender."""
+
+    _ARRAYS = ('counts', 'sizes', 'ranked', 'flags')
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.index = {}  # sender -> ID
+        self.names = []  # ID -> sender
+        self.counts = np.zeros(capacity, dtype=np.int64)  # scanned messages
+        self.sizes = np.zeros(capacity, dtype=np.int64)   # scanned bytes
+        self.ranked = np.zeros(capacity, dtype=np.int64)  # count the ranking uses; lags `counts` on add(rerank=False)
+        self.flags = np.zeros(capacity, dtype=np.uint8)
+
+    @classmethod
+    def from_arrays(cls, names, counts, sizes, ranked, flags):
+        """Table over already-interned senders, e.g. read back from a snapshot."""
+        table = cls(capacity=max(len(names), 1))
+        table.names = list(names)
+        table.index = {sender: sender_id for sender_id, sender in enumerate(table.names)}
+        for name, values in zip(cls._ARRAYS, (counts, sizes, ranked, flags)):
+            getattr(table, name)[:len(values)] = values
+        return table
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, sender):
+        """The sender's ID, assigning the next one the first time it is seen."""
+        sender_id = self.index.get(sender)
+        if sender_id is None:
+            sender_id = self.index[sender] = len(self.names)
+            self.names.append(sender)
+            if sender_id == len(self.counts):
+                for name in self._ARRAYS:
+                    old = getattr(self, name)
+                    grown = np.zeros(2 * len(old), dtype=old.dtype)
+                    grown[:len(old)] = old
+                    setattr(self, name, grown)
+        return sender_id
+
+    def intern_many(self, senders):
+        return np.fromiter((self.intern(sender) for sender in senders), dtype=np.intp)
+
+    def add(self, senders, counts, sizes, rerank=True):
+        """Adds messages and bytes per sender (negative to take them away).
+
+        With rerank=False the ranking keeps the old counts, so actioned rows
+        don't jump around while their messages are being trashed.
+        """
+        ids = self.intern_many(senders)
+        np.add.at(self.counts, ids, counts)
+        np.add.at(self.sizes, ids, sizes)
+        if rerank:
+            self.ranked[ids] = self.counts[ids]
+        return ids
+
+    def count(self, sender):
+        sender_id = self.index.get(sender)
+        return 0 if sender_id is None else int(self.counts[sender_id])
+
+    def size(self, sender):
+        sender_id = self.index.get(sender)
+        return 0 if sender_id is None else int(self.sizes[sender_id])
+
+    def has_flag(self, sender, flag):
+        sender_id = self.index.get(sender)
+        return sender_id is not None and bool(self.flags[sender_id] & flag)
+
+    def set_flag(self, sender, flag):
+        self.flags[self.intern(sender)] |= flag
+
+    def clear_flag(self, sender, flag):
+        sender_id = self.index.get(sender)
+        if sender_id is not None:
+            self.flags[sender_id] &= ~np.uint8(flag)
+
+    def flagged(self, flag):
+        """Senders carrying flag, in first-seen order."""
+        return [self.names[i] for i in np.flatnonzero(self.flags[:len(self.names)] & flag)]
+
+    def copy_flags(self, other, flags):
+        """Carries the given flags of other's senders over to this table."""
+        for sender in other.flagged(flags):
+            self.set_flag(sender, other.flags[other.index[sender]] & flags)
+
+    def top(self, n, by='count', exclude=(), hide=IGNORED | HIDDEN):
+        """The n heaviest (sender, messages) or (sender, bytes) pairs, skipping flagged senders."""
+        if n <= 0:
+            return []
+        size = len(self.names)
+        values = (self.ranked if by == 'count' else self.sizes)[:size]
+        mask = ((self.flags[:size] & hide) == 0) & (values > 0)
+        for sender in exclude:
+            sender_id = self.index.get(sender)
+            if sender_id is not None:
+                mask[sender_id] = False
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-values[candidates], n - 1)[:n]]
+        # Heaviest first; ties go to the sender seen first
+        candidates = candidates[np.lexsort((candidates, -values[candidates]))]
+        return [(self.names[i], int(values[i])) for i in candidates]